@@ -0,0 +1,16 @@
+"""
+原子写文件：先写同目录下的临时文件再 os.replace，读取方（其他进程、node_exporter 等）不会读到写了一半的文件。
+"""
+import os
+
+
+def write_atomic(path: str, data):
+    """写入 str（UTF-8）或 bytes。阻塞IO，在事件循环中应通过 asyncio.to_thread 调用"""
+    tmp_path = path + ".tmp"
+    if isinstance(data, bytes):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,61 @@
+"""
+接口响应解码微基准：对比原先 response.text() + response.json() 两次解码的做法与
+bytes 一次解码 + 转换为紧凑记录的做法（标准库 json，安装了 orjson 时也测 orjson）。
+
+    python plugins/GetWeather/benchmarks/bench_json.py [-n 迭代次数] [--days 7]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+from mock_qweather import MockQWeather  # noqa: E402
+from records import CurrentWeather, Forecast  # noqa: E402
+
+
+def bench(func, body: bytes, iterations: int) -> float:
+    """返回每次解码的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(body)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=7, help="天气预报天数（和风天气有 3d/7d/10d/15d）")
+    args = parser.parse_args()
+
+    mock = MockQWeather(days=args.days)
+    payloads = {
+        "now": (json.dumps(mock.now_payload(), ensure_ascii=False).encode(), CurrentWeather),
+        "7d": (json.dumps(mock.daily_payload(), ensure_ascii=False).encode(), Forecast),
+    }
+
+    def old_path(body):
+        # 原 _request_json：text() 解码一次字符串，json() 再解码一次字符串并解析
+        body.decode("utf-8")
+        return json.loads(body.decode("utf-8"))
+
+    paths = [("text()+json() 原实现", lambda record: old_path),
+             ("bytes 一次解码 + 转换记录（json）", lambda record: lambda body: record.from_json(json.loads(body)))]
+    if json_codec.orjson is not None:
+        orjson = json_codec.orjson
+        paths.append(("bytes 一次解码 + 转换记录（orjson）",
+                      lambda record: lambda body: record.from_json(orjson.loads(body))))
+    else:
+        print("未安装orjson，跳过对比")
+
+    for name, (body, record) in payloads.items():
+        print(f"\n{name}: 响应 {len(body)} 字节")
+        for label, make in paths:
+            print(f"  {label:32} {bench(make(record), body, args.iterations):8.2f} us/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+负载测试：启动本地模拟的和风天气接口（mock_qweather.py），用桩 WechatAPIClient 按 Zipf 分布的城市热度
+生成消息，以固定并发数调用 handle_text，统计消息延迟 p50/p95/p99、吞吐量和每条查询的上游请求数。
+需要在机器人根目录（包含 plugins/、WechatAPI/、utils/，且已配置好 GetWeather 的 config.toml）下运行：
+
+    python plugins/GetWeather/benchmarks/bench_load.py [-n 消息数] [-c 并发数] [--latency 0.05] [--error-rate 0.01]
+
+每次结果追加到 --results 指定的 JSON Lines 文件，并与相同场景参数的上一次结果对比。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.getcwd())
+
+from mock_qweather import UNKNOWN_LOCATIONS, MockQWeather  # noqa: E402
+
+CITIES = [
+    "北京", "上海", "广州", "深圳", "成都", "杭州", "重庆", "武汉", "西安", "南京",
+    "天津", "苏州", "长沙", "郑州", "东莞", "青岛", "沈阳", "宁波", "昆明", "合肥",
+    "佛山", "福州", "厦门", "哈尔滨", "济南", "温州", "大连", "长春", "石家庄", "南宁",
+    "贵阳", "南昌", "太原", "无锡", "乌鲁木齐", "兰州", "海口", "呼和浩特", "银川", "西宁",
+    "拉萨", "珠海", "惠州", "中山", "烟台", "泉州", "徐州", "常州", "南通", "绍兴",
+]
+
+TEMPLATES = ["天气 {}", "{}天气", "天气{}", "查一下{}的天气", "{}天气怎么样"]
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_results.jsonl")
+
+
+class StubBot:
+    """只记录发送内容的 WechatAPIClient 替身"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_at_message(self, wxid, content, at=None):
+        self.sent.append(content)
+
+    async def send_text_message(self, wxid, content):
+        self.sent.append(content)
+
+
+def make_messages(count: int, cities: int, skew: float, multi_ratio: float, unknown_ratio: float, seed: int) -> list:
+    """按 Zipf 分布（第 k 热门的城市权重为 1/k^skew）生成消息，含少量多城市和不存在的城市"""
+    rng = random.Random(seed)
+    names = (CITIES + [f"测试城{i}" for i in range(max(0, cities - len(CITIES)))])[:cities]
+    weights = [1 / (rank ** skew) for rank in range(1, len(names) + 1)]
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < unknown_ratio:
+            text = f"天气 {rng.choice(UNKNOWN_LOCATIONS)}"
+        elif roll < unknown_ratio + multi_ratio:
+            text = "天气 " + "、".join(dict.fromkeys(rng.choices(names, weights, k=3)))
+        else:
+            text = rng.choice(TEMPLATES).format(rng.choices(names, weights)[0])
+        messages.append(text)
+    return messages
+
+
+def percentile(samples: list, p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+async def run(args) -> dict:
+    mock = MockQWeather(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, days=args.days,
+                        seed=args.seed)
+    api_host = await mock.start()
+
+    module = __import__(args.module, fromlist=["GetWeather"])
+    plugin = module.GetWeather()
+    plugin.api_host = api_host
+    # 压测时关闭用户/群限频；上游限流和每日配额默认也关闭，--keep-limits 时按配置生效
+    plugin.user_queries_per_minute = 0
+    plugin.group_queries_per_minute = 0
+    if not args.keep_limits:
+        plugin.upstream_limiter = None
+        plugin.endpoint_limiters.clear()
+        plugin.quota.daily_quota = sys.maxsize
+    plugin.logger.setLevel(args.log_level)
+    await plugin.async_init()
+
+    messages = make_messages(args.warmup + args.messages, args.cities, args.skew, args.multi_ratio,
+                             args.unknown_ratio, args.seed)
+    queue = asyncio.Queue()
+    for index, text in enumerate(messages):
+        queue.put_nowait((index, text))
+
+    latencies = []
+    errors = 0
+    measured_calls = None
+    started = None
+
+    async def worker():
+        nonlocal measured_calls, started, errors
+        while not queue.empty():
+            index, text = queue.get_nowait()
+            if index == args.warmup:
+                # 预热结束：此后的上游请求和耗时计入结果
+                measured_calls = dict(mock.calls)
+                started = time.perf_counter()
+            message = {"Content": text, "FromWxid": f"room{index % 20}@chatroom", "SenderWxid": f"user{index}"}
+            bot = StubBot()
+            begin = time.perf_counter()
+            await plugin.handle_text(bot, message)
+            if index >= args.warmup:
+                latencies.append(time.perf_counter() - begin)
+                errors += any("⚠️" in reply for reply in bot.sent)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await plugin.on_disable()
+        await mock.stop()
+
+    measured_calls = measured_calls or {}
+    calls = {name: count - measured_calls.get(name, 0) for name, count in sorted(mock.calls.items())}
+    return {
+        "messages": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "msgs_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1e3, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1e3, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1e3, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1e3, 2),
+        "upstream_calls": calls,
+        "upstream_per_query": round(sum(calls.values()) / len(latencies), 3),
+        # 含有 ⚠️ 提示的回复，包括查询不存在城市的消息
+        "error_replies": errors,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def previous_result(path: str, scenario: dict):
+    """结果文件中相同场景参数的上一次结果"""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("scenario") == scenario:
+                previous = record
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--messages", type=int, default=2000, help="计入结果的消息数")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="同时处理的消息数")
+    parser.add_argument("--warmup", type=int, default=200, help="预热消息数，不计入结果")
+    parser.add_argument("--cities", type=int, default=200, help="城市数量")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf 分布指数，越大越集中在热门城市")
+    parser.add_argument("--multi-ratio", type=float, default=0.05, help="多城市消息比例")
+    parser.add_argument("--unknown-ratio", type=float, default=0.02, help="不存在城市的消息比例")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟接口的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="模拟接口的随机额外延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟接口返回500的比例")
+    parser.add_argument("--days", type=int, default=7, help="天气预报返回的天数（影响响应大小）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-limits", action="store_true", help="保留配置中的上游限流和每日配额")
+    parser.add_argument("--module", default="plugins.GetWeather.main")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="结果文件（JSON Lines），为空则不保存")
+    parser.add_argument("--label", default="", help="本次结果的备注")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    scenario = {key: getattr(args, key) for key in (
+        "messages", "concurrency", "warmup", "cities", "skew", "multi_ratio", "unknown_ratio",
+        "latency", "jitter", "error_rate", "days", "seed", "keep_limits")}
+    result = asyncio.run(run(args))
+
+    print(f"消息数: {result['messages']}  并发: {args.concurrency}  耗时: {result['elapsed_s']} s")
+    print(f"吞吐量: {result['msgs_per_s']} 条/秒")
+    print(f"延迟:   p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  "
+          f"平均 {result['mean_ms']} ms")
+    print(f"上游请求: {result['upstream_calls']}  每条查询 {result['upstream_per_query']} 次")
+    print(f"错误回复: {result['error_replies']}")
+
+    if not args.results:
+        return
+    previous = previous_result(args.results, scenario)
+    if previous is not None:
+        print(f"\n对比上一次（{previous['time']} {previous.get('revision', '')} {previous.get('label', '')}）:")
+        for key in ("msgs_per_s", "p50_ms", "p95_ms", "p99_ms", "upstream_per_query"):
+            old, new = previous["result"][key], result[key]
+            change = f"{(new - old) / old:+.1%}" if old else "-"
+            print(f"  {key:20} {old:>10} -> {new:<10} {change}")
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "label": args.label,
+        "scenario": scenario,
+        "result": result,
+    }
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"\n结果已追加到 {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+缓存内存占用基准：用 tracemalloc 测量每个城市在缓存中占用的字节数，
+对比保存完整接口 JSON（原实现）与保存 records 中的紧凑记录。
+
+    python plugins/GetWeather/benchmarks/bench_memory.py [-n 城市数] [--days 7]
+"""
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_qweather import MockQWeather  # noqa: E402
+from records import CurrentWeather, Forecast, Location  # noqa: E402
+
+
+def measure(build, count: int) -> float:
+    """build(i) 返回一个城市的缓存内容，返回每个城市平均占用的字节数"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    cache = {i: build(i) for i in range(count)}
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del cache
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--cities", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=7, help="天气预报天数")
+    args = parser.parse_args()
+
+    mock = MockQWeather(days=args.days)
+    # 每个城市单独解码，模拟各自收到的响应
+    bodies = [(json.dumps(mock.geo_payload(f"测试城{i}"), ensure_ascii=False).encode(),
+               json.dumps(mock.now_payload(), ensure_ascii=False).encode(),
+               json.dumps(mock.daily_payload(), ensure_ascii=False).encode()) for i in range(args.cities)]
+
+    def raw_json(i):
+        geo, now, daily = bodies[i]
+        return json.loads(geo)["location"][0], json.loads(now), json.loads(daily)
+
+    def records(i):
+        geo, now, daily = bodies[i]
+        return (Location.from_json(json.loads(geo)["location"][0]), CurrentWeather.from_json(json.loads(now)),
+                Forecast.from_json(json.loads(daily)))
+
+    before = measure(raw_json, args.cities)
+    after = measure(records, args.cities)
+    print(f"城市数: {args.cities}，预报天数: {args.days}")
+    print(f"完整JSON:  {before:8.0f} 字节/城市")
+    print(f"紧凑记录:  {after:8.0f} 字节/城市（{after / before:.1%}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+查询解析微基准：对比 QueryParser 与原先逐条 jieba 分词的耗时。
+
+    python plugins/GetWeather/benchmarks/bench_parser.py [-n 迭代次数]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_parser import QueryParser  # noqa: E402
+
+MESSAGES = [
+    "天气 北京",
+    "天气北京",
+    "北京天气",
+    "北京 天气",
+    "上海天气怎么样",
+    "查一下广州的天气",
+    "天气 乌鲁木齐",
+    "今天深圳天气如何？",
+    "天气",
+]
+
+
+def bench(func, iterations: int) -> float:
+    """返回每条消息的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in MESSAGES:
+            func(message)
+    return (time.perf_counter() - start) / (iterations * len(MESSAGES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    query_parser = QueryParser()
+    for message in MESSAGES:
+        print(f"{message!r:24} -> {query_parser.parse(message)}")
+    print()
+    print(f"QueryParser.parse: {bench(query_parser.parse, args.iterations):8.2f} us/条")
+
+    try:
+        import jieba
+    except ImportError:
+        print("未安装jieba，跳过对比")
+        return
+
+    start = time.perf_counter()
+    jieba.initialize()
+    print(f"jieba 词典加载:    {(time.perf_counter() - start) * 1e3:8.1f} ms（原实现在首条消息时于事件循环中执行）")
+
+    def jieba_path(message):
+        # 原 handle_text 的做法
+        return "".join(word for word in jieba.cut(message) if word != "天气")
+
+    print(f"jieba.cut:         {bench(jieba_path, args.iterations):8.2f} us/条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+回复生成微基准：对比原 compose_weather_message（每次拼接字符串并解析 updateTime）、编译后的回复模板，
+以及回复缓存命中（同一份数据的重复查询）的每秒生成次数。
+
+    python plugins/GetWeather/benchmarks/bench_render.py [-n 迭代次数] [--cities 城市数]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import MISSING, TTLCache  # noqa: E402
+from mock_qweather import MockQWeather  # noqa: E402
+from records import CurrentWeather, Forecast  # noqa: E402
+from templates import ReplyTemplate  # noqa: E402
+
+
+def legacy_compose(country, adm1, adm2, now, forecast):
+    """原实现（逐段拼接，每次解析更新时间），用于对比"""
+    try:
+        formatted_update_time = datetime.fromisoformat(now.update_time).strftime("%m-%d %H:%M")
+    except ValueError:
+        formatted_update_time = now.update_time
+    message = (
+        f"{country}{adm1}{adm2} 实时天气☁️\n"
+        f"⏰更新时间：{formatted_update_time}\n\n"
+        f"🌡️当前温度：{now.temp}℃\n"
+        f"🌡️体感温度：{now.feels_like}℃\n"
+        f"☁️天气：{now.text}\n"
+    )
+    if forecast.days:
+        message += f"☀️紫外线指数：{forecast.days[0].uv_index}\n"
+    message += (
+        f"🌬️风向：{now.wind_dir}\n"
+        f"🌬️风力：{now.wind_scale}级\n"
+        f"💦湿度：{now.humidity}%\n"
+        f"🌧️降水量：{now.precip}mm/h\n"
+        f"👀能见度：{now.vis}km\n\n"
+    )
+    if adm2:
+        message += f"☁️未来3天 {adm2} 天气：\n"
+    elif adm1:
+        message += f"☁️未来3天 {adm1} 天气：\n"
+    else:
+        message += "☁️未来3天天气：\n"
+    for day in forecast.days[1:4]:
+        formatted_date = '.'.join([d.lstrip('0') for d in day.date.split('-')[1:]]) or day.date
+        message += (f'{formatted_date} {day.text_day} 最高🌡️{day.temp_max}℃ '
+                    f'最低🌡️{day.temp_min}℃ ☀️紫外线:{day.uv_index}\n')
+    if len(forecast.days) < 2:
+        message += "未来几天天气预报数据暂缺。\n"
+    return message.strip()
+
+
+def bench(func, cities: list, iterations: int) -> float:
+    """返回每秒生成的消息数"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(*cities[i % len(cities)])
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=200000)
+    parser.add_argument("--cities", type=int, default=50, help="不同城市数（回复缓存的键数）")
+    args = parser.parse_args()
+
+    mock = MockQWeather()
+    cities = [
+        (f"10100{i:04d}", "中国", "测试省", f"测试城{i}",
+         CurrentWeather.from_json(json.loads(json.dumps(mock.now_payload()))),
+         Forecast.from_json(json.loads(json.dumps(mock.daily_payload()))))
+        for i in range(args.cities)
+    ]
+    template = ReplyTemplate()
+    reply_cache = TTLCache(maxsize=1024, ttl=3600)
+
+    def cached(city_id, country, adm1, adm2, now, forecast):
+        key = (city_id, now.update_time, forecast.update_time, template)
+        message = reply_cache.get(key)
+        if message is MISSING:
+            message = template.render(country, adm1, adm2, now, forecast)
+            reply_cache.set(key, message)
+        return message
+
+    sample = cities[0]
+    assert legacy_compose(*sample[1:]) == template.render(*sample[1:]), "模板输出与原实现不一致"
+
+    results = [
+        ("原实现（拼接字符串）", bench(lambda _, *rest: legacy_compose(*rest), cities, args.iterations)),
+        ("编译后的模板", bench(lambda _, *rest: template.render(*rest), cities, args.iterations)),
+        ("回复缓存命中", bench(cached, cities, args.iterations)),
+    ]
+    baseline = results[0][1]
+    print(f"城市数: {args.cities}，迭代: {args.iterations}")
+    for label, rate in results:
+        print(f"  {label:16} {rate:12,.0f} 条/秒  {1e6 / rate:6.2f} us/条  x{rate / baseline:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+插件启动耗时测量：在全新的子进程中分别测量导入 main 模块和执行 GetWeather() 的耗时，取中位数。
+需要在机器人根目录（包含 plugins/、WechatAPI/、utils/ 的目录）下运行：
+
+    python plugins/GetWeather/benchmarks/bench_startup.py [-n 次数] [--max-import-ms 100] [--max-init-ms 20]
+
+超过阈值时返回非0，可用于 CI 发现启动耗时回退。
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module} as plugin_main
+imported = time.perf_counter()
+plugin_main.GetWeather()
+initialized = time.perf_counter()
+
+def loaded(name):
+    module = sys.modules.get(name)
+    return module is not None and type(module).__name__ != "_LazyModule"
+
+print(json.dumps({{
+    "import_ms": (imported - start) * 1e3,
+    "init_ms": (initialized - imported) * 1e3,
+    "loaded": {{name: loaded(name) for name in ("aiohttp", "jwt", "jieba")}},
+}}))
+"""
+
+
+def measure(module: str) -> dict:
+    output = subprocess.check_output([sys.executable, "-c", PROBE.format(module=module)], stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("--module", default="plugins.GetWeather.main")
+    parser.add_argument("--max-import-ms", type=float, help="导入耗时中位数上限（毫秒）")
+    parser.add_argument("--max-init-ms", type=float, help="__init__ 耗时中位数上限（毫秒）")
+    args = parser.parse_args()
+
+    results = [measure(args.module) for _ in range(args.runs)]
+    import_ms = statistics.median(result["import_ms"] for result in results)
+    init_ms = statistics.median(result["init_ms"] for result in results)
+
+    print(f"导入 {args.module}: {import_ms:8.2f} ms（中位数，{args.runs} 次）")
+    print(f"GetWeather():{'':14}{init_ms:8.2f} ms")
+    print(f"启动后已加载的重量级模块: {results[-1]['loaded']}")
+
+    failed = False
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"导入耗时超过上限 {args.max_import_ms} ms")
+        failed = True
+    if args.max_init_ms is not None and init_ms > args.max_init_ms:
+        print(f"__init__ 耗时超过上限 {args.max_init_ms} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+本地模拟的和风天气接口，用于基准测试，提供 /geo/v2/city/lookup、/v7/weather/now、/v7/weather/7d、
+/v7/weather/24h、/v7/air/now、/v7/warning/now、/v7/indices/1d。
+
+可配置固定延迟、随机抖动、错误率（返回500）和天气预报天数；不校验 JWT。
+calls 记录每个接口被请求的次数。
+"""
+import asyncio
+import random
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+# 模拟不存在的地名，城市查询返回404
+UNKNOWN_LOCATIONS = ("不存在", "火星")
+
+
+class MockQWeather:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0, days: int = 7,
+                 seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.days = days
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._runner = None
+        self.url = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务，port 为0时自动选择端口，返回 api-host"""
+        app = web.Application()
+        app.router.add_get("/geo/v2/city/lookup", self._geo)
+        app.router.add_get("/v7/weather/now", self._now)
+        app.router.add_get("/v7/weather/7d", self._daily)
+        app.router.add_get("/v7/weather/24h", self._hourly)
+        app.router.add_get("/v7/air/now", self._air)
+        app.router.add_get("/v7/warning/now", self._warning)
+        app.router.add_get("/v7/indices/1d", self._indices)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _respond(self, name: str, build):
+        self.calls[name] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.Response(status=500, text="mock error")
+        return web.json_response(build())
+
+    @staticmethod
+    def city_id(name: str) -> str:
+        return str(101000000 + zlib.crc32(name.encode()) % 1000000)
+
+    def geo_payload(self, name: str) -> dict:
+        if name in UNKNOWN_LOCATIONS:
+            return {"code": "404"}
+        return {"code": "200", "location": [{
+            "name": name, "id": self.city_id(name), "lat": "39.90", "lon": "116.40",
+            "adm2": name, "adm1": f"{name}省", "country": "中国", "tz": "Asia/Shanghai",
+            "utcOffset": "+08:00", "isDst": "0", "type": "city", "rank": "10", "fxLink": "https://www.qweather.com",
+        }], "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]}}
+
+    def now_payload(self) -> dict:
+        now = datetime.now().astimezone()
+        return {"code": "200", "updateTime": now.strftime("%Y-%m-%dT%H:%M%z"), "fxLink": "https://www.qweather.com",
+                "now": {"obsTime": now.strftime("%Y-%m-%dT%H:%M%z"), "temp": "20", "feelsLike": "19", "icon": "100",
+                        "text": "晴", "wind360": "0", "windDir": "北风", "windScale": "3", "windSpeed": "15",
+                        "humidity": "40", "precip": "0.0", "pressure": "1012", "vis": "10", "cloud": "10",
+                        "dew": "6"},
+                "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]}}
+
+    def daily_payload(self) -> dict:
+        today = datetime.now().astimezone()
+        daily = [{
+            "fxDate": (today + timedelta(days=i)).strftime("%Y-%m-%d"), "sunrise": "06:20", "sunset": "17:40",
+            "moonrise": "12:00", "moonset": "23:00", "moonPhase": "盈凸月", "moonPhaseIcon": "803",
+            "tempMax": "25", "tempMin": "12", "iconDay": "100", "textDay": "晴", "iconNight": "150",
+            "textNight": "晴", "wind360Day": "0", "windDirDay": "北风", "windScaleDay": "1-3",
+            "windSpeedDay": "10", "wind360Night": "0", "windDirNight": "北风", "windScaleNight": "1-3",
+            "windSpeedNight": "5", "humidity": "40", "precip": "0.0", "pressure": "1012", "vis": "25",
+            "cloud": "5", "uvIndex": "5",
+        } for i in range(self.days)]
+        return {"code": "200", "updateTime": today.strftime("%Y-%m-%dT%H:%M%z"), "fxLink": "https://www.qweather.com",
+                "daily": daily, "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]}}
+
+    @staticmethod
+    def _envelope(**data) -> dict:
+        now = datetime.now().astimezone()
+        return {"code": "200", "updateTime": now.strftime("%Y-%m-%dT%H:%M%z"), "fxLink": "https://www.qweather.com",
+                **data, "refer": {"sources": ["QWeather"], "license": ["QWeather Developers License"]}}
+
+    def hourly_payload(self) -> dict:
+        start = datetime.now().astimezone().replace(minute=0, second=0, microsecond=0)
+        return self._envelope(hourly=[{
+            "fxTime": (start + timedelta(hours=i + 1)).strftime("%Y-%m-%dT%H:%M%z"), "temp": str(15 + i % 8),
+            "icon": "100", "text": "晴", "wind360": "0", "windDir": "北风", "windScale": "1-3", "windSpeed": "10",
+            "humidity": "40", "pop": "0", "precip": "0.0", "pressure": "1012", "cloud": "5", "dew": "6",
+        } for i in range(24)])
+
+    def air_payload(self) -> dict:
+        return self._envelope(now={
+            "pubTime": datetime.now().astimezone().strftime("%Y-%m-%dT%H:%M%z"), "aqi": "42", "level": "1",
+            "category": "优", "primary": "NA", "pm10": "35", "pm2p5": "20", "no2": "15", "so2": "3", "co": "0.5",
+            "o3": "60",
+        })
+
+    def warning_payload(self) -> dict:
+        return self._envelope(warning=[])
+
+    def indices_payload(self) -> dict:
+        names = {"1": ("运动指数", "适宜"), "2": ("洗车指数", "较适宜"), "3": ("穿衣指数", "舒适"),
+                 "5": ("紫外线指数", "中等"), "8": ("舒适度指数", "舒适"), "9": ("感冒指数", "少发")}
+        today = datetime.now().strftime("%Y-%m-%d")
+        return self._envelope(daily=[
+            {"date": today, "type": index_type, "name": name, "level": "1", "category": category, "text": ""}
+            for index_type, (name, category) in names.items()
+        ])
+
+    async def _geo(self, request):
+        name = request.query.get("location", "").strip()
+        return await self._respond("geo", lambda: self.geo_payload(name))
+
+    async def _now(self, request):
+        return await self._respond("now", self.now_payload)
+
+    async def _daily(self, request):
+        return await self._respond("7d", self.daily_payload)
+
+    async def _hourly(self, request):
+        return await self._respond("24h", self.hourly_payload)
+
+    async def _air(self, request):
+        return await self._respond("air", self.air_payload)
+
+    async def _warning(self, request):
+        return await self._respond("warning", self.warning_payload)
+
+    async def _indices(self, request):
+        return await self._respond("indices", self.indices_payload)
@@ -0,0 +1,116 @@
+import heapq
+import math
+import time
+from collections import OrderedDict
+
+# get() 未命中时的默认返回值，用于区分"未缓存"和"缓存了None（负缓存）"
+MISSING = object()
+
+
+class TTLCache:
+    """
+    进程内的 LRU + TTL 缓存。
+    条目数超过 maxsize 时淘汰最久未使用的条目；每个条目可单独指定过期时间。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        """读取缓存，过期条目视为未命中并删除"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """写入缓存，ttl 为空时使用默认过期时间"""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def remaining(self, key):
+        """条目剩余的有效时间（秒），不存在或已过期时返回 None；不影响命中统计和LRU顺序"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        remaining = entry[0] - time.monotonic()
+        return remaining if remaining > 0 else None
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class DecayingCounter:
+    """
+    按时间衰减的访问计数（LFU），用于统计热门城市。
+    计数每经过 half_life 秒减半；条目数超过 maxsize 时淘汰分数最低的一半。
+    """
+
+    def __init__(self, half_life: float, maxsize: int = 10000):
+        self.half_life = half_life
+        self.maxsize = maxsize
+        self._scores = {}  # key -> (score, updated_at)
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * math.pow(0.5, (now - updated_at) / self.half_life)
+
+    def record(self, key, weight: float = 1.0):
+        now = time.monotonic()
+        score, updated_at = self._scores.get(key, (0.0, now))
+        self._scores[key] = (self._decayed(score, updated_at, now) + weight, now)
+        if len(self._scores) > self.maxsize:
+            for stale_key, _ in self.top(len(self._scores))[self.maxsize // 2:]:
+                del self._scores[stale_key]
+
+    def top(self, n: int, min_score: float = 0.0) -> list:
+        """分数最高、且不低于 min_score 的 n 个 [(key, score)]"""
+        now = time.monotonic()
+        scores = ((key, self._decayed(score, updated_at, now)) for key, (score, updated_at) in self._scores.items())
+        return heapq.nlargest(n, (item for item in scores if item[1] >= min_score), key=lambda item: item[1])
+
+    def prune(self, min_score: float = 0.01) -> int:
+        """删除衰减后分数低于 min_score 的条目（默认约7个半衰期没有访问），返回删除的条数"""
+        now = time.monotonic()
+        stale = [key for key, (score, updated_at) in self._scores.items()
+                 if self._decayed(score, updated_at, now) < min_score]
+        for key in stale:
+            del self._scores[key]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._scores)
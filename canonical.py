@@ -0,0 +1,243 @@
+"""
+地名规范化，分两步：
+- query：全角/半角、大小写、多余的标点和空白、拼音、固定别名，得到发给城市查询接口的地名（保留“市/区/县”后缀）；
+- key：在 query 上去掉后缀等，作为地名缓存、请求合并、查询队列和持久化缓存的键，同一地点的不同写法共用一次城市查询。
+去掉后缀可能变成另一个地方（朝阳市/北京的朝阳，黄山区/黄山市），只有确认是同一个地方时才去掉：
+离线城市索引收录了去掉后缀的地名（“市”要求是城市，“区/县”要求是区县而不是同名的市或省），
+或者两种写法学到的别名是同一个城市ID（“市”前面是 PINYIN_CITIES 中的城市时直接去掉）；“自治区/自治县”不去。
+
+别名表由两部分组成：
+- 配置中的固定别名（location-aliases，例如 "帝都" = "北京"）；
+- 从城市查询结果学到的别名：键 -> 城市查询接口对这个键返回的城市ID（连同城市记录一起保存），
+  之后这个键直接得到同一个城市，不再经过离线索引或城市查询接口，重启后也不变；
+  超过 ttl（与地名缓存相同）后失效，重新查询，城市查询接口返回别的城市ID时更新。
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+
+DEFAULT_SUFFIXES = ("市", "区", "县")
+# 去掉后是城市名的后缀（北京市/北京），其他后缀去掉后应是区县名（海淀区/海淀）
+CITY_SUFFIXES = ("市",)
+
+# 省级行政区，以及 PINYIN_CITIES 中的城市：没有离线城市索引时，只去掉跟在这些地名后面的“省/市”
+PROVINCES = (
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江", "安徽", "福建", "江西",
+    "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西", "甘肃", "青海", "台湾", "内蒙古",
+    "广西", "西藏", "宁夏", "新疆", "香港", "澳门",
+)
+# 以“市”开头的区名（济南市中区、青岛市北区），前面的“市”不是上级行政区
+ADMIN_LED_DISTRICTS = ("市中", "市北", "市南")
+
+# 直辖市、省会和常见城市的拼音（没有离线城市索引时也能把拼音映射到汉字，有索引时由索引中的英文名补充）
+PINYIN_CITIES = {
+    "beijing": "北京", "peking": "北京", "shanghai": "上海", "tianjin": "天津", "chongqing": "重庆",
+    "guangzhou": "广州", "shenzhen": "深圳", "hongkong": "香港", "xianggang": "香港", "macau": "澳门",
+    "macao": "澳门", "aomen": "澳门", "taibei": "台北", "taipei": "台北", "shijiazhuang": "石家庄",
+    "taiyuan": "太原", "huhehaote": "呼和浩特", "hohhot": "呼和浩特", "shenyang": "沈阳", "changchun": "长春",
+    "haerbin": "哈尔滨", "harbin": "哈尔滨", "nanjing": "南京", "hangzhou": "杭州", "hefei": "合肥",
+    "fuzhou": "福州", "nanchang": "南昌", "jinan": "济南", "zhengzhou": "郑州", "wuhan": "武汉",
+    "changsha": "长沙", "nanning": "南宁", "haikou": "海口", "chengdu": "成都", "guiyang": "贵阳",
+    "kunming": "昆明", "lasa": "拉萨", "lhasa": "拉萨", "xian": "西安", "lanzhou": "兰州", "xining": "西宁",
+    "yinchuan": "银川", "wulumuqi": "乌鲁木齐", "urumqi": "乌鲁木齐", "dalian": "大连", "qingdao": "青岛",
+    "ningbo": "宁波", "xiamen": "厦门", "suzhou": "苏州", "wuxi": "无锡", "dongguan": "东莞", "foshan": "佛山",
+    "zhuhai": "珠海", "sanya": "三亚",
+}
+
+# 空白、标点和符号（汉字、字母、数字之外的字符）
+_NON_WORD = re.compile(r"[\W_]+")
+# 两个 ASCII 单词之间的空白保留为一个空格（"los angeles"），与 query_parser 一致
+_ASCII_GAP = re.compile(r"(?<=[a-z0-9])\s+(?=[a-z0-9])")
+# 地名中间的“省/市”，跟在已知的省或城市名后面时去掉：北京市朝阳 -> 北京朝阳
+_INNER_ADMIN = re.compile(r"[省市]")
+
+
+def clean(raw: str) -> str:
+    """全角转半角（NFKC）、大小写折叠，去掉标点和空白（ASCII 单词之间保留一个空格）"""
+    words = _ASCII_GAP.split(unicodedata.normalize("NFKC", raw).casefold().strip())
+    return " ".join(filter(None, (_NON_WORD.sub("", word) for word in words)))
+
+
+class LocationCanonicalizer:
+    """
+    canonical(raw) 返回 query，并按 key(query) 记录对应的原始写法（report 的数据）。
+    index 为离线城市索引（可选，加载后由插件设置）：用于把索引收录的拼音映射到汉字，
+    以及确认去掉后缀或中间的“省/市”后仍是同一个地方。ttl 为学到的别名的有效期（秒），0为不过期。
+    """
+
+    def __init__(self, aliases: dict = None, suffixes=DEFAULT_SUFFIXES, path: str = "", decode=tuple,
+                 max_learned: int = 10000, max_keys: int = 5000, max_variants: int = 20, ttl: float = 0):
+        self.suffixes = tuple(suffixes)
+        self.path = path
+        self.decode = decode   # 把别名文件中的 JSON 数组还原为城市记录（records.Location.from_row）
+        self.ttl = ttl
+        self.index = None
+        self.max_learned = max_learned
+        self.max_keys = max_keys
+        self.max_variants = max_variants
+        self.manual = {}
+        for alias, target in (aliases or {}).items():
+            self.manual[clean(alias)] = clean(target)
+        self.learned = {}      # 键 -> (城市ID, 学到的时间)
+        self.locations = {}    # 城市ID -> 城市记录
+        self.variants = {}     # 键 -> {原始写法}
+        self.alias_hits = 0
+        self.dirty = False     # 学到的别名有未写入文件的修改
+
+    def query(self, raw: str) -> str:
+        """发给城市查询接口的地名：清理写法、拼音转汉字、固定别名，不去后缀"""
+        text = clean(raw)
+        if text.isascii():
+            text = PINYIN_CITIES.get(text.replace(" ", ""), text)
+            if text.isascii() and text and self.index is not None:
+                found = self.index.lookup(text)
+                if found is not None:
+                    text = clean(found["name"]) or text
+        alias = self.manual.get(text)
+        if alias is None:
+            return text
+        self.alias_hits += 1
+        return alias
+
+    def _strippable(self, text: str, shorter: str, suffix: str) -> bool:
+        if shorter.endswith("自治"):
+            return False  # 内蒙古自治区、长阳土家族自治县
+        learned = self.learned.get(text)
+        if learned is not None and learned[0] == self.learned.get(shorter, (None,))[0]:
+            return True
+        if suffix in CITY_SUFFIXES and shorter in PINYIN_CITIES.values():
+            return True  # 内置的常见城市（北京市/北京）
+        if self.index is None:
+            return False
+        # 和风天气的地名不带“市/区/县”，带后缀的写法一般不在索引中，用去掉后缀的写法确认
+        short = self.index.lookup(shorter)
+        if short is None:
+            return False
+        found = self.index.lookup(text)
+        if found is not None:
+            return found["id"] == short["id"]
+        is_city = short["name"] in (short["adm1"], short["adm2"])
+        return is_city if suffix in CITY_SUFFIXES else not is_city
+
+    def _is_admin(self, name: str) -> bool:
+        """name 是否为省或城市（地级市、直辖市）的名字"""
+        if name in PROVINCES or name in PINYIN_CITIES.values():
+            return True
+        found = self.index.lookup(name) if self.index is not None else None
+        return found is not None and name in (found["adm1"], found["adm2"])
+
+    def _drop_inner_admin(self, text: str) -> str:
+        """去掉跟在省或城市名后面、后面还有至少两个字的“省/市”：广东省广州市天河 -> 广东广州天河"""
+        names = []
+        start = 0
+        while True:
+            match = _INNER_ADMIN.search(text, start + 2)
+            if match is None or len(text) - match.end() < 2:
+                break
+            rest = text[match.start():]
+            if rest.startswith(ADMIN_LED_DISTRICTS) or (self.index is not None and self.index.lookup(rest) is not None):
+                break  # 济南市中区：“市中”是区名
+            name = text[start:match.start()]
+            if not self._is_admin(name):
+                break
+            names.append(name)
+            start = match.end()
+        return "".join(names) + text[start:]
+
+    def key(self, query: str) -> str:
+        """缓存键：去掉跟在省或城市名后面的“省/市”，以及可以去掉的后缀"""
+        text = self._drop_inner_admin(query)
+        for suffix in self.suffixes:
+            if text.endswith(suffix) and len(text) - len(suffix) >= 2:
+                if self._strippable(text, text[:-len(suffix)], suffix):
+                    text = text[:-len(suffix)]
+                break
+        return text
+
+    def canonical(self, raw: str) -> str:
+        query = self.query(raw)
+        key = self.key(query)
+        raws = self.variants.get(key)
+        if raws is None:
+            if len(self.variants) >= self.max_keys:
+                return query
+            raws = self.variants[key] = set()
+        if len(raws) < self.max_variants:
+            raws.add(raw)
+        return query
+
+    def resolve(self, key: str):
+        """按学到的别名返回城市记录，没有或已过期时返回 None（过期的别名删除，由调用方重新查询）"""
+        entry = self.learned.get(key)
+        if entry is None:
+            return None
+        location_id, learned_at = entry
+        if self.ttl and time.time() - learned_at > self.ttl:
+            del self.learned[key]
+            self.dirty = True
+            return None
+        self.alias_hits += 1
+        return self.locations[location_id]
+
+    def learn(self, key: str, location):
+        """城市查询接口返回 key 的结果后调用，location 为城市记录（有 id 字段）；已有的别名更新为这次的结果"""
+        if key not in self.learned and len(self.learned) >= self.max_learned:
+            return
+        self.learned[key] = (location.id, time.time())
+        self.locations[location.id] = location
+        self.dirty = True
+
+    def report(self, top: int = 10) -> list:
+        """
+        原始写法最多的 top 个地点：[(名称, 不同写法数, [写法...])]，只列出有两种以上写法的地点。
+        学到别名的键按城市ID合并（名称为 城市名(ID)），其他键各自一项。
+        """
+        groups = {}
+        for key, raws in self.variants.items():
+            location_id = self.learned.get(key, (None,))[0]
+            label = key if location_id is None else f"{self.locations[location_id].name}({location_id})"
+            groups.setdefault(label, set()).update(raws)
+        rows = sorted(((label, len(raws), sorted(raws)) for label, raws in groups.items() if len(raws) > 1),
+                      key=lambda row: row[1], reverse=True)
+        return rows[:top]
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.variants),
+            "raw": sum(len(raws) for raws in self.variants.values()),
+            "manual": len(self.manual),
+            "learned": len(self.learned),
+            "alias_hits": self.alias_hits,
+        }
+
+    def load(self):
+        """
+        读取学到的别名；无法还原的城市记录及指向它的别名跳过，其他版本的文件忽略。
+        版本2的文件没有学到的时间，按文件修改时间计算有效期。
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        version = data.get("version")
+        if version not in (2, 3):
+            return
+        saved_at = os.path.getmtime(self.path)
+        for location_id, row in data.get("locations", {}).items():
+            try:
+                self.locations[location_id] = self.decode(row)
+            except (TypeError, ValueError):
+                continue
+        for key, entry in data.get("aliases", {}).items():
+            location_id, learned_at = (entry, saved_at) if version == 2 else entry
+            if location_id in self.locations:
+                self.learned.setdefault(key, (location_id, learned_at))
+
+    def dumps(self) -> str:
+        """学到的别名的 JSON 快照"""
+        location_ids = {location_id for location_id, _ in self.learned.values()}
+        data = {"version": 3, "aliases": self.learned,
+                "locations": {location_id: self.locations[location_id] for location_id in location_ids}}
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
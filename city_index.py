@@ -0,0 +1,191 @@
+"""
+离线城市索引：由和风天气 LocationList CSV 构建，查询城市时无需调用城市查询接口。
+
+索引文件格式（小端）：
+    MAGIC(8字节) | 记录数 N (uint32) | 偏移表 uint32[N+1] | 记录数据
+每条记录为 "key\\x1fid\\x1fname\\x1fcountry\\x1fadm1\\x1fadm2" 的 UTF-8 编码，按 key 排序。
+运行时通过 mmap 打开并二分查找，只有被访问到的页才会进入内存。
+
+重新生成索引：
+    python plugins/GetWeather/city_index.py build China-City-List-latest.csv plugins/GetWeather/city_index.bin
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+
+try:
+    from .atomic_file import write_atomic
+except ImportError:  # 作为脚本运行（python city_index.py build ...）
+    from atomic_file import write_atomic
+
+MAGIC = b"GWCITY1\n"
+SEP = "\x1f"
+FIELDS = ("id", "name", "country", "adm1", "adm2")
+
+# LocationList CSV 列名
+CSV_COLUMNS = {
+    "id": "Location_ID",
+    "name": "Location_Name_ZH",
+    "name_en": "Location_Name_EN",
+    "country": "Country_Region_ZH",
+    "adm1": "Adm1_Name_ZH",
+    "adm2": "Adm2_Name_ZH",
+}
+
+_HEADER = struct.Struct("<I")
+
+
+def normalize_key(name: str) -> str:
+    """索引键：去掉所有空白并转小写"""
+    return "".join(name.split()).lower()
+
+
+def read_location_csv(csv_path: str) -> list:
+    """读取 LocationList CSV，返回 location 字典列表（字段同城市查询接口）"""
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+
+    # 文件开头可能有版本说明行，从 Location_ID 表头开始解析
+    for header_index, row in enumerate(rows):
+        if row and row[0].strip() == CSV_COLUMNS["id"]:
+            break
+    else:
+        raise ValueError(f"{csv_path} 中未找到表头 {CSV_COLUMNS['id']}")
+
+    header = [column.strip() for column in rows[header_index]]
+    missing = [column for column in CSV_COLUMNS.values() if column not in header]
+    if missing:
+        raise ValueError(f"{csv_path} 缺少列: {', '.join(missing)}")
+    positions = {field: header.index(column) for field, column in CSV_COLUMNS.items()}
+
+    locations = []
+    for row in rows[header_index + 1:]:
+        if len(row) < len(header) or not row[positions["id"]].strip():
+            continue
+        locations.append({field: row[position].strip() for field, position in positions.items()})
+    return locations
+
+
+def _index_keys(location: dict):
+    """一个地点对应的索引键及优先级（数值越小越优先）"""
+    name = location["name"]
+    # 地级市/直辖市本身优先于同名的区县，例如"朝阳"
+    rank = 0 if name in (location["adm1"], location["adm2"]) else 1
+    yield normalize_key(name), rank
+    if location.get("name_en"):
+        yield normalize_key(location["name_en"]), rank
+    for parent in (location["adm2"], location["adm1"]):
+        if parent and parent != name:
+            # "北京朝阳"、"北京 朝阳" 这类带上级行政区的写法
+            yield normalize_key(parent + name), 0
+
+
+def build_index_bytes(locations: list) -> bytes:
+    """把 location 列表编码为索引文件内容"""
+    best = {}  # key -> (rank, 顺序, location)
+    for order, location in enumerate(locations):
+        for key, rank in _index_keys(location):
+            if key and (key not in best or (rank, order) < best[key][:2]):
+                best[key] = (rank, order, location)
+
+    records = []
+    for key in sorted(best, key=lambda k: k.encode("utf-8")):
+        location = best[key][2]
+        records.append(SEP.join([key] + [location[field] for field in FIELDS]).encode("utf-8"))
+
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+    return b"".join([
+        MAGIC,
+        _HEADER.pack(len(records)),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        *records,
+    ])
+
+
+def build_index(csv_path: str, out_path: str) -> int:
+    """由 CSV 生成索引文件，返回索引键数量"""
+    data = build_index_bytes(read_location_csv(csv_path))
+    write_atomic(out_path, data)
+    return _HEADER.unpack_from(data, len(MAGIC))[0]
+
+
+class CityIndex:
+    """只读城市索引，lookup() 返回与城市查询接口相同字段的 location 字典"""
+
+    def __init__(self, buffer, source: str = ""):
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"城市索引格式错误: {source}")
+        self._buffer = buffer
+        self.source = source
+        self._count = _HEADER.unpack_from(buffer, len(MAGIC))[0]
+        self._offsets_start = len(MAGIC) + _HEADER.size
+        self._data_start = self._offsets_start + 4 * (self._count + 1)
+
+    @classmethod
+    def open(cls, path: str) -> "CityIndex":
+        """打开索引：.csv 文件在内存中构建，其余按索引文件 mmap 打开"""
+        if path.lower().endswith(".csv"):
+            return cls(build_index_bytes(read_location_csv(path)), path)
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path)
+
+    def _record(self, i: int) -> bytes:
+        start, end = struct.unpack_from("<II", self._buffer, self._offsets_start + 4 * i)
+        return self._buffer[self._data_start + start:self._data_start + end]
+
+    def lookup(self, name: str):
+        """按地名查找，未收录时返回 None"""
+        key = normalize_key(name).encode("utf-8") + SEP.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            if record.startswith(key):
+                values = record.decode("utf-8").split(SEP)[1:]
+                return dict(zip(FIELDS, values))
+            if record < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __len__(self):
+        return self._count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="和风天气离线城市索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="由 LocationList CSV 生成索引文件")
+    build_parser.add_argument("csv_path", help="LocationList CSV 文件路径")
+    build_parser.add_argument("out_path", help="输出的索引文件路径")
+
+    lookup_parser = subparsers.add_parser("lookup", help="在索引中查找地名")
+    lookup_parser.add_argument("index_path", help="索引文件路径")
+    lookup_parser.add_argument("names", nargs="+", help="地名")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        count = build_index(args.csv_path, args.out_path)
+        print(f"已生成 {args.out_path}: {count} 个索引键, {os.path.getsize(args.out_path)} 字节")
+    else:
+        index = CityIndex.open(args.index_path)
+        for name in args.names:
+            print(f"{name}: {index.lookup(name)}")
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
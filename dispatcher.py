@@ -0,0 +1,111 @@
+"""
+有界工作队列：固定数量的 worker 处理天气查询，排队的任务数有上限，上游突发时不会同时发起成百上千个请求、拖慢整个机器人。
+"""
+import asyncio
+import time
+
+
+class QueueFull(Exception):
+    """排队的任务数已达上限，新任务被拒绝（由调用方降级处理）"""
+
+
+class _Job:
+    __slots__ = ("key", "items", "future", "enqueued_at")
+
+    def __init__(self, key, item, future):
+        self.key = key
+        self.items = [item]
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class WorkQueue:
+    """
+    workers 个 worker 按先进先出执行 handler(key, items)，排队（尚未开始）的任务最多 max_depth 个。
+    相同 key 的任务在排队期间合并：后提交的 item 追加到已排队的任务上，handler 只执行一次，所有提交者等待同一个结果。
+    任务开始执行后再提交相同 key 会重新排队（结果可能已经变化）。
+    on_wait(秒) 在任务开始执行时调用，用于统计排队时间。
+    """
+
+    def __init__(self, handler, workers: int = 8, max_depth: int = 100, on_wait=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.on_wait = on_wait
+        self._queue = None      # 首次提交时创建，需要运行中的事件循环
+        self._pending = {}      # key -> 排队中的 _Job
+        self._worker_tasks = []
+        self.busy = 0           # 正在执行的任务数
+        self.submitted = 0
+        self.merged = 0         # 合并到已排队任务的提交次数
+        self.rejected = 0       # 队列已满被拒绝的提交次数
+
+    @property
+    def depth(self) -> int:
+        """排队中（尚未开始执行）的任务数"""
+        return len(self._pending)
+
+    async def submit(self, key, item):
+        """提交任务并等待 handler 的结果；队列已满时抛出 QueueFull。等待者被取消不会取消任务本身"""
+        job = self._pending.get(key)
+        if job is not None:
+            job.items.append(item)
+            self.merged += 1
+        else:
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull(key)
+            if self._queue is None:
+                self._start()
+            job = _Job(key, item, asyncio.get_running_loop().create_future())
+            self._pending[key] = job
+            self._queue.put_nowait(job)
+        self.submitted += 1
+        return await asyncio.shield(job.future)
+
+    def _start(self):
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            del self._pending[job.key]
+            if self.on_wait is not None:
+                self.on_wait(time.monotonic() - job.enqueued_at)
+            self.busy += 1
+            try:
+                result = await self.handler(job.key, job.items)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                job.future.set_exception(e)
+                # 所有提交者都已取消时也读取异常，避免 "exception was never retrieved" 警告
+                job.future.exception()
+            else:
+                job.future.set_result(result)
+            finally:
+                self.busy -= 1
+
+    async def close(self):
+        """停止 worker，取消排队中的任务"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        for job in self._pending.values():
+            job.future.cancel()
+        self._pending.clear()
+        self._queue = None
+        self._worker_tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "merged": self.merged,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,85 @@
+"""
+检查并安装 GetWeather 插件的依赖。插件导入时不再自动安装，部署或升级后手动执行：
+
+    python plugins/GetWeather/install.py            # 安装缺少的必需依赖
+    python plugins/GetWeather/install.py --check    # 只检查，缺少依赖时返回非0
+    python plugins/GetWeather/install.py --optional # 同时安装可选依赖
+"""
+import argparse
+import importlib.util
+import subprocess
+import sys
+
+# pip包名 -> 导入名
+REQUIRED_PACKAGES = {
+    "aiohttp": "aiohttp",
+    "PyJWT": "jwt",
+    "cryptography": "cryptography",  # PyJWT 的 EdDSA 签名需要
+}
+
+OPTIONAL_PACKAGES = {
+    "jieba": "jieba",  # 查询解析的分词兜底
+    "orjson": "orjson",  # 更快的接口响应解码
+}
+
+PIP_INDEX_URL = "https://pypi.tuna.tsinghua.edu.cn/simple"
+PIP_TRUSTED_HOST = "pypi.tuna.tsinghua.edu.cn"
+
+
+def missing_packages(packages: dict) -> list:
+    """返回未安装的pip包名"""
+    return [package for package, import_name in packages.items() if importlib.util.find_spec(import_name) is None]
+
+
+def install_packages(packages: list, index_url: str = PIP_INDEX_URL, trusted_host: str = PIP_TRUSTED_HOST):
+    """使用当前解释器的 pip 安装依赖"""
+    for package in packages:
+        print(f"正在安装依赖: {package}")
+        try:
+            subprocess.check_call([
+                sys.executable,
+                "-m",
+                "pip",
+                "install",
+                package,
+                "-i",
+                index_url,
+                "--trusted-host",
+                trusted_host
+            ])
+            print(f"成功安装 {package}")
+        except subprocess.CalledProcessError as e:
+            print(f"安装 {package} 失败: {str(e)}")
+            raise RuntimeError(f"无法安装必要的依赖: {package}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="检查并安装 GetWeather 插件依赖")
+    parser.add_argument("--check", action="store_true", help="只检查依赖，不安装")
+    parser.add_argument("--optional", action="store_true", help="同时处理可选依赖")
+    parser.add_argument("-i", "--index-url", default=PIP_INDEX_URL, help="pip 镜像地址")
+    args = parser.parse_args(argv)
+
+    packages = dict(REQUIRED_PACKAGES)
+    if args.optional:
+        packages.update(OPTIONAL_PACKAGES)
+
+    missing = missing_packages(packages)
+    optional_missing = [package for package in missing_packages(OPTIONAL_PACKAGES) if package not in missing]
+    if optional_missing:
+        print(f"未安装可选依赖: {', '.join(optional_missing)}")
+
+    if not missing:
+        print("依赖检查通过")
+        return 0
+    if args.check:
+        print(f"缺少依赖: {', '.join(missing)}")
+        return 1
+
+    host = args.index_url.split("//", 1)[-1].split("/", 1)[0]
+    install_packages(missing, args.index_url, host)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
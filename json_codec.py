@@ -0,0 +1,20 @@
+"""
+接口响应的 JSON 解码：响应体只读取一次（bytes），只解码一次；安装了 orjson 时使用 orjson，否则使用标准库 json。
+解码结果随即转换为 records 中的紧凑记录，缓存和旧数据里不保存完整响应。
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(body: bytes):
+    """解码 UTF-8 JSON，格式错误时抛出 ValueError（orjson.JSONDecodeError 也是 ValueError 的子类）"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
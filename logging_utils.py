@@ -0,0 +1,104 @@
+"""
+插件日志：记录先放入队列，由后台线程格式化并写出，事件循环上只做入队。
+
+- 日志消息使用 %s 占位符延迟格式化，被级别或采样过滤掉的记录不做字符串拼接；
+- 响应体等长文本用 truncated() 包装，写出时才截断；
+- 逐请求的日志带上 extra=SAMPLED，按 log-sample-rate 采样，突发流量时减少日志量。
+"""
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# 逐请求日志的 extra 参数，受采样率控制
+SAMPLED = {"sampled": True}
+
+
+class truncated:
+    """延迟截断的长文本（bytes 按 UTF-8 解码），格式化日志时才转成字符串"""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        text = value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+        if self.limit and len(text) > self.limit:
+            return f"{text[:self.limit]}...(共{len(text)}字符)"
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """按比例保留带 sampled 标记的记录；警告及以上级别总是保留"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    不在调用线程中格式化的 QueueHandler：标准库的 prepare() 会在入队前格式化消息和异常堆栈，
+    这里直接把记录交给监听线程，由监听线程的处理器格式化。
+    """
+
+    def __init__(self, log_queue, handlers: list, propagate: bool):
+        super().__init__(log_queue)
+        self.dropped = 0            # 队列满时丢弃的记录数
+        self.handlers = handlers    # logger 自己的处理器，停止时放回 logger
+        self.propagate = propagate  # logger 原来的 propagate，停止时恢复
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def start_queue_logging(logger: logging.Logger, handlers: list, sample_rate: float = 1.0,
+                        maxsize: int = 10000):
+    """
+    把 logger 的输出改为经队列交给后台线程的 handlers，返回已启动的监听器，插件卸载时调用 stop_queue_logging。
+    原本会通过 propagate 传给上级 logger（例如根 logger）的处理器也交给后台线程，队列期间关闭 propagate，
+    否则记录仍会在调用线程中同步写到上级处理器。
+    队列满时丢弃新记录，不阻塞事件循环。logger 已经在使用队列时返回 None。
+    """
+    if any(isinstance(handler, DeferredQueueHandler) for handler in logger.handlers):
+        return None
+    inherited = []
+    parent = logger
+    while parent.propagate and parent.parent is not None:
+        parent = parent.parent
+        inherited.extend(handler for handler in parent.handlers if handler not in inherited)
+    log_queue = queue.Queue(maxsize)
+    queue_handler = DeferredQueueHandler(log_queue, list(handlers), logger.propagate)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    listener = QueueListener(log_queue, *handlers, *inherited, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_queue_logging(logger: logging.Logger, listener: QueueListener):
+    """写出队列中剩余的记录并停止后台线程，恢复为直接输出"""
+    listener.stop()
+    for handler in list(logger.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            logger.removeHandler(handler)
+            for own in handler.handlers:
+                logger.addHandler(own)
+            logger.propagate = handler.propagate
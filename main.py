@@ -1,51 +1,143 @@
+from __future__ import annotations
+
 import sys
-import subprocess
 import importlib.util
 import asyncio
 import logging
 import time
 import os
 import tomllib
-import aiohttp
-import jwt
-import jieba
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import NamedTuple
 
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
 from utils.plugin_base import PluginBase
 
-# 检查并安装必要的依赖
-def check_and_install_dependencies():
-    """检查并安装必要的依赖"""
-    required_packages = {
-        'aiohttp': 'aiohttp',
-        'PyJWT': 'PyJWT',
-        'cryptography': 'cryptography', # PyJWT[crypto] often pulls this
-        'jieba': 'jieba'
-    }
-
-    for package, import_name in required_packages.items():
-        if importlib.util.find_spec(import_name) is None:
-            print(f"正在安装依赖: {package}")
-            try:
-                subprocess.check_call([
-                    sys.executable,
-                    "-m",
-                    "pip",
-                    "install",
-                    package,
-                    "-i",
-                    "https://pypi.tuna.tsinghua.edu.cn/simple",
-                    "--trusted-host",
-                    "pypi.tuna.tsinghua.edu.cn"
-                ])
-                print(f"成功安装 {package}")
-            except subprocess.CalledProcessError as e:
-                print(f"安装 {package} 失败: {str(e)}")
-                raise RuntimeError(f"无法安装必要的依赖: {package}")
-
-# 安装依赖
-check_and_install_dependencies()
+from .atomic_file import write_atomic
+from .cache import MISSING, DecayingCounter, TTLCache
+from .canonical import DEFAULT_SUFFIXES, LocationCanonicalizer
+from .city_index import CityIndex
+from .dispatcher import QueueFull, WorkQueue
+from . import json_codec
+from .logging_utils import SAMPLED, start_queue_logging, stop_queue_logging, truncated
+from .metrics import MetricsRegistry
+from .persistent_cache import PersistentCache
+from .planner import DEFAULT_INTENT, INTENTS, plan
+from .resilience import CircuitBreaker, LatencyTracker, QuotaCounter, RetryBudget, TokenBucket, backoff_delay
+from .query_parser import QueryParser, segment_location
+from .records import (FORMAT_VERSION, AirQuality, CurrentWeather, Forecast, HourlyForecast, LifeIndices, Location,
+                      WeatherAlerts)
+from .singleflight import SingleFlight
+from .subscription import Subscription, SubscriptionStore, parse_subscription_command
+from .templates import DEFAULT_DAY_TEMPLATE, DEFAULT_TEMPLATE, RENDERERS, ReplyTemplate
+
+
+def lazy_import(name: str):
+    """
+    延迟导入模块：首次访问属性时才真正执行导入，加快插件加载。
+    依赖不再在导入时自动安装，缺少时请运行 python plugins/GetWeather/install.py
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"缺少依赖 {name}，请运行: python plugins/GetWeather/install.py")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+aiohttp = lazy_import("aiohttp")
+jwt = lazy_import("jwt")
+
+
+class Endpoint(NamedTuple):
+    """和风天气接口描述：名称、路径、日志名称、失败时回复给用户的提示，以及响应转换成的缓存记录类型"""
+    name: str
+    path: str
+    label: str
+    fail_reply: str
+    format_reply: str
+    record: type = None     # records 中的记录类型，from_json 从响应中取出需要的字段
+    params: str = ""        # location 之外的固定查询参数
+
+
+GEO_ENDPOINT = Endpoint(
+    "geo", "/geo/v2/city/lookup", "城市查询",
+    "\n⚠️城市查询服务暂时不可用，请稍后重试", "\n⚠️城市查询服务响应格式错误",
+)
+
+# 按城市ID查询的接口，每种查询类型需要哪些接口见 planner.INTENTS
+CITY_ENDPOINTS = {
+    "now": Endpoint(
+        "now", "/v7/weather/now", "实时天气",
+        "\n⚠️获取实时天气失败，请稍后重试", "\n⚠️实时天气服务响应格式错误",
+        record=CurrentWeather,
+    ),
+    "7d": Endpoint(
+        "7d", "/v7/weather/7d", "天气预报",
+        "\n⚠️获取天气预报失败，请稍后重试", "\n⚠️天气预报服务响应格式错误",
+        record=Forecast,
+    ),
+    "24h": Endpoint(
+        "24h", "/v7/weather/24h", "逐小时预报",
+        "\n⚠️获取逐小时预报失败，请稍后重试", "\n⚠️逐小时预报服务响应格式错误",
+        record=HourlyForecast,
+    ),
+    "air": Endpoint(
+        "air", "/v7/air/now", "空气质量",
+        "\n⚠️获取空气质量失败，请稍后重试", "\n⚠️空气质量服务响应格式错误",
+        record=AirQuality,
+    ),
+    "warning": Endpoint(
+        "warning", "/v7/warning/now", "天气预警",
+        "\n⚠️获取天气预警失败，请稍后重试", "\n⚠️天气预警服务响应格式错误",
+        record=WeatherAlerts,
+    ),
+    "indices": Endpoint(
+        "indices", "/v7/indices/1d", "生活指数",
+        "\n⚠️获取生活指数失败，请稍后重试", "\n⚠️生活指数服务响应格式错误",
+        record=LifeIndices, params="&type=1,2,3,5,8,9",  # 运动、洗车、穿衣、紫外线、舒适度、感冒
+    ),
+}
+
+# 默认天气回复（实时天气+天气预报）的接口，订阅推送、热门城市预取按这组接口进行，顺序即出错时优先报告的顺序
+WEATHER_ENDPOINTS = {name: CITY_ENDPOINTS[name] for name in INTENTS[DEFAULT_INTENT].endpoints}
+
+
+# 管理员查看运行指标的命令（发送者需在 metrics-admins 中）
+METRICS_COMMAND = "天气监控"
+# 管理员查看地名规范化报告的命令：每个规范化的键合并了多少种原始写法
+LOCATION_REPORT_COMMAND = "天气地名"
+
+WEATHER_MESSAGE_HEADER = "----- 小胰宝助手提醒您关注天气 -----"
+
+
+class QWeatherAPIError(Exception):
+    """和风天气接口请求失败，reply 为回复给用户的提示，retryable 表示可以重试（5xx、429）"""
+
+    def __init__(self, reply: str, retryable: bool = False):
+        super().__init__(reply)
+        self.reply = reply
+        self.retryable = retryable
+
+
+class QWeatherAuthError(QWeatherAPIError):
+    """接口返回401，token被拒绝，应换新token后重试"""
+
+
+class QWeatherRateLimited(QWeatherAPIError):
+    """本地限流拒绝了请求，没有发出上游请求，不计入熔断器"""
+
+
+class LocationNotFound(QWeatherAPIError):
+    """城市查询接口没有找到这个地名"""
+
 
 class GetWeather(PluginBase):
     """天气查询插件"""
@@ -53,10 +145,34 @@ class GetWeather(PluginBase):
     name = "GetWeather"
     description = "获取实时天气和天气预报"
     author = "samqin-小x宝社区-服务癌症和罕见病患者的开源公益社区欢迎加入！"
-    version = "1.0.11" # Incremented version
+    version = "1.0.35"
 
     # Change Log
     changes = [
+        "1.0.35: 查询前规范化地名（全角/半角、标点、市/区/县后缀、拼音、别名），同一地点的不同写法共用缓存，并从城市查询结果学习别名",
+        "1.0.34: 支持逐小时预报、空气质量、天气预警和生活指数查询，按查询类型只请求需要的接口，共用的接口只请求一次",
+        "1.0.33: 可配置的回复模板（加载时编译），生成的回复按城市和数据更新时间缓存",
+        "1.0.32: 天气查询进入有界队列由固定数量的worker处理，同一聊天的相同查询排队时合并，队列满时用缓存回答或提示稍后再试",
+        "1.0.31: 可选的SQLite持久化缓存，重启后预热，多个进程共享，后台清理过期条目",
+        "1.0.30: 缓存中保存紧凑的城市、实时天气和天气预报记录，不再保存接口JSON",
+        "1.0.29: 响应体只读取和解码一次，可选orjson解码，只保留生成消息需要的字段",
+        "1.0.28: 日志经队列由后台线程写出，逐请求日志延迟格式化并支持采样，响应体日志限制长度",
+        "1.0.27: 各阶段耗时直方图、缓存/上游状态码计数和进行中请求数，支持导出Prometheus文本格式和管理员命令查看",
+        "1.0.26: 私钥只解析一次，JWT在后台线程提前签发和轮换，接口返回401时换新token重试，不再记录token日志",
+        "1.0.25: 上游调用令牌桶限流与每日配额统计，用户/群查询限频，配额不足时优先使用缓存",
+        "1.0.24: 接口连接/读取超时、单次查询总时限、带抖动的重试、可选对冲请求及重试预算",
+        "1.0.23: 接口熔断器；上游故障或过慢时返回标明时间的旧数据并后台重新验证",
+        "1.0.22: 统计热门城市并在缓存过期前后台预取，预取次数受每日配额比例限制",
+        "1.0.21: 每日天气订阅推送，按城市合并请求并限制发送速度",
+        "1.0.20: 支持一条消息查询多个城市，并发查询并合并回复",
+        "1.0.19: 导入时不再自动安装依赖（改为install.py），aiohttp/jwt延迟导入，城市索引首次使用时加载",
+        "1.0.18: 使用轻量查询解析器代替逐条jieba分词，jieba改为线程中按需加载的兜底",
+        "1.0.17: 支持由LocationList生成的离线城市索引，命中时不再调用城市查询接口",
+        "1.0.16: 合并并发的相同城市查询和天气请求（single-flight）",
+        "1.0.15: 按城市ID缓存实时天气和天气预报，缓存时间由updateTime推算",
+        "1.0.14: 城市查询结果LRU+TTL缓存，未找到的城市短期负缓存",
+        "1.0.13: 并发请求实时天气和天气预报接口",
+        "1.0.12: 使用插件级共享aiohttp会话（连接池、keep-alive、DNS缓存）",
         "1.0.11: 实现JWT token缓存和提前5分钟自动刷新机制",
         "1.0.10: 更新JWT生成逻辑，使用新的API认证方式",
         "1.0.9: 添加依赖版本检查",
@@ -95,16 +211,184 @@ class GetWeather(PluginBase):
         # 设置配置
         self.api_host = config["api-host"]
         self.private_key = config["api-key"] # This should be the actual private key string
+        self.signing_key = self._load_signing_key(self.private_key)
         self.jwt_kid = config["jwt-kid"]
         self.jwt_sub = config["jwt-sub"]
 
         # Token caching attributes
         self.cached_token = None
         self.token_expiry_time = 0  # Unix timestamp (seconds)
-        self.token_refresh_lead_time = 5 * 60  # 5 minutes in seconds
+        self.token_refresh_lead_time = config.get("jwt-refresh-lead-time", 5 * 60)  # 提前刷新的时间（秒）
         self.token_default_lifespan = 24* 15 * 60 # 15 minutes in seconds, as per example (900s)
                                              # If API allows 24h, this could be 24 * 60 * 60
 
+        # 离线城市索引：由 LocationList 生成，首次查询时在线程中加载；未配置或文件不存在时只使用城市查询接口
+        self.city_index_path = config.get("city-index", "plugins/GetWeather/city_index.bin")
+        self.city_index = None
+        self._city_index_loaded = False
+
+        # 查询解析：默认使用轻量解析器，无法确定地名时可选用 jieba 分词兜底
+        self.query_parser = QueryParser()
+        self.jieba_fallback = config.get("jieba-fallback", True)
+
+        # 地名规范化：同一地点的不同写法映射到同一个键；从城市查询结果学到的别名保存到 location-alias-file（为空时不保存）
+        self.canonicalizer = LocationCanonicalizer(
+            aliases=config.get("location-aliases", {}),
+            suffixes=config.get("location-strip-suffixes", DEFAULT_SUFFIXES),
+            path=config.get("location-alias-file", "plugins/GetWeather/location_aliases.json"),
+            decode=Location.from_row,
+            ttl=config.get("geo-cache-ttl", 7 * 24 * 3600),
+        )
+
+        # 多城市查询：单条消息最多城市数，以及同时查询的城市数
+        self.max_cities = config.get("max-cities", 5)
+        self.batch_concurrency = config.get("batch-concurrency", 3)
+
+        # 回复模板：加载时编译，字段写错时启动即报错；生成的回复按 (城市ID, 实时天气和预报的updateTime, 模板) 缓存，
+        # 同一份数据只生成一次消息
+        self.reply_template = ReplyTemplate(
+            config.get("reply-template", DEFAULT_TEMPLATE),
+            config.get("reply-day-template", DEFAULT_DAY_TEMPLATE),
+        )
+        self.reply_cache = TTLCache(maxsize=config.get("reply-cache-size", 1024), ttl=3 * 3600)
+
+        # 每日天气推送：订阅在首次使用时加载
+        self.push_enable = config.get("push-enable", True)
+        self.push_default_time = config.get("push-default-time", "07:30")
+        self.push_rate = config.get("push-rate", 2)  # 每秒最多发送的推送消息数
+        self.push_max_per_user = config.get("push-max-per-user", 5)
+        self.subscriptions = SubscriptionStore(config.get("subscription-file", "plugins/GetWeather/subscriptions.json"))
+        self._subscriptions_loaded = False
+        self._subscriptions_lock = asyncio.Lock()
+        self._push_checked_until = None  # 已检查过的最后一个推送时间点（分钟）
+
+        # HTTP连接池配置（插件内所有和风天气请求共享同一个会话）
+        self.http_pool_limit = config.get("http-pool-limit", 100)
+        self.http_pool_limit_per_host = config.get("http-pool-limit-per-host", 20)
+        self.http_dns_cache_ttl = config.get("http-dns-cache-ttl", 300)
+        self.http_keepalive_timeout = config.get("http-keepalive-timeout", 60)
+        self._session = None  # 首次请求时再创建，需要运行中的事件循环
+
+        # 城市查询缓存：LocationID 基本不变，正常结果长期缓存，未找到的结果短期缓存
+        self.geo_cache = TTLCache(
+            maxsize=config.get("geo-cache-size", 2048),
+            ttl=config.get("geo-cache-ttl", 7 * 24 * 3600),
+        )
+        self.geo_cache_negative_ttl = config.get("geo-cache-negative-ttl", 600)
+
+        # 天气数据缓存：按接口分别缓存，键为城市ID
+        # weather-cache-ttl 为各接口的数据刷新周期（秒），实际缓存时间由响应的 updateTime 推算
+        self.weather_cache_ttl = {
+            "now": 600,    # 实时天气约10分钟更新一次
+            "7d": 3 * 3600,  # 天气预报每天更新数次
+            "24h": 3600,
+            "air": 3600,     # 空气质量每小时更新
+            "warning": 600,
+            "indices": 3 * 3600,
+        }
+        self.weather_cache_ttl.update(config.get("weather-cache-ttl", {}))
+        self.weather_cache_min_ttl = config.get("weather-cache-min-ttl", 60)
+        weather_cache_size = config.get("weather-cache-size", 1024)
+        self.weather_cache = {
+            name: TTLCache(maxsize=weather_cache_size, ttl=self.weather_cache_ttl[name])
+            for name in CITY_ENDPOINTS
+        }
+
+        # 热门城市预取：按衰减访问计数挑出前N个城市，在缓存过期前后台刷新
+        self.popularity = DecayingCounter(half_life=config.get("popularity-half-life", 3600))
+        self.prefetch_enable = config.get("prefetch-enable", True)
+        self.prefetch_top_n = config.get("prefetch-top-n", 20)
+        # 分数低于此值的城市不预取（分数约为最近一个半衰期内的查询次数），很久以前查过一次的城市不会一直占用配额
+        self.prefetch_min_score = config.get("prefetch-min-score", 1.5)
+        self.prefetch_lead_time = config.get("prefetch-lead-time", 120)
+        # 预取每天最多使用的接口调用次数 = api-daily-quota * prefetch-quota-share
+        self.api_daily_quota = config.get("api-daily-quota", 1000)
+        self.prefetch_quota_share = config.get("prefetch-quota-share", 0.2)
+        self._prefetch_day = None
+        self._prefetch_calls_today = 0
+
+        # 配额与限流：所有上游请求共享全局令牌桶，也可以按接口单独限制（0为不限制）；每日用量低于水位时优先使用缓存
+        self.quota = QuotaCounter(self.api_daily_quota, low_watermark=config.get("quota-low-watermark", 0.1))
+        self._quota_alert_level = 0
+        rate_limit = config.get("rate-limit-per-minute", 300)
+        self.upstream_limiter = TokenBucket.per_minute(rate_limit) if rate_limit else None
+        self.endpoint_limiters = {
+            name: TokenBucket.per_minute(limit) for name, limit in config.get("endpoint-rate-limits", {}).items() if limit
+        }
+        self.rate_limit_max_wait = config.get("rate-limit-max-wait", 1.0)
+        # 用户和群的查询频率限制（每分钟次数），令牌桶按 wxid 缓存
+        self.user_queries_per_minute = config.get("user-queries-per-minute", 6)
+        self.group_queries_per_minute = config.get("group-queries-per-minute", 30)
+        self._query_limiters = TTLCache(maxsize=10000, ttl=3600)
+
+        # 熔断与旧数据：每个接口一个熔断器；保留每个城市最近一次成功的数据，上游故障或过慢时返回
+        self.breakers = {
+            endpoint.name: CircuitBreaker(
+                endpoint.label,
+                failure_threshold=config.get("breaker-failure-threshold", 5),
+                reset_timeout=config.get("breaker-reset-timeout", 30),
+                slow_call_threshold=config.get("breaker-slow-call", 5.0),
+            )
+            for endpoint in (GEO_ENDPOINT, *CITY_ENDPOINTS.values())
+        }
+        self.stale_latency_budget = config.get("stale-latency-budget", 2.0)
+        self.stale_max_age = config.get("stale-max-age", 24 * 3600)
+        self.stale_weather = {
+            name: TTLCache(maxsize=weather_cache_size, ttl=self.stale_max_age)
+            for name in CITY_ENDPOINTS
+        }
+        self._background_tasks = set()
+
+        # 持久化缓存：城市查询和天气结果写入 SQLite，重启后预热内存缓存，同机多个进程共享；为空时不启用
+        self.persistent_cache = None
+        persistent_cache_path = config.get("persistent-cache", "")
+        if persistent_cache_path:
+            self.persistent_cache = PersistentCache(persistent_cache_path, {
+                GEO_ENDPOINT.name: Location.from_row,
+                **{name: endpoint.record.from_row for name, endpoint in CITY_ENDPOINTS.items()},
+            }, version=FORMAT_VERSION)
+
+        # 超时与重试：每个接口的连接/读取超时，单次查询的总时限，带抖动退避的重试，可选的对冲请求
+        self.timeout_connect = config.get("timeout-connect", 3.0)
+        self.timeout_read = config.get("timeout-read", 5.0)
+        self.endpoint_timeouts = config.get("endpoint-timeouts", {})
+        self._client_timeouts = {}
+        self.query_timeout = config.get("query-timeout", 10.0)
+        self.retry_max_attempts = config.get("retry-max-attempts", 2)
+        self.retry_base_delay = config.get("retry-base-delay", 0.2)
+        self.retry_max_delay = config.get("retry-max-delay", 2.0)
+        self.retry_budget = RetryBudget(
+            ratio=config.get("retry-budget-ratio", 0.2),
+            min_per_second=config.get("retry-budget-min-per-second", 1.0),
+        )
+        self.hedge_enable = config.get("hedge-enable", False)
+        self.hedge_min_delay = config.get("hedge-min-delay", 0.3)
+        self.latency = {endpoint.name: LatencyTracker() for endpoint in (GEO_ENDPOINT, *CITY_ENDPOINTS.values())}
+
+        # 合并进行中的相同上游请求，inflight.coalesced 记录被合并的次数
+        self.inflight = SingleFlight()
+
+        # 指标：各阶段耗时直方图、上游状态码计数和进行中的请求数，导出为 Prometheus 文本格式
+        self.metrics = MetricsRegistry(prefix="getweather_")
+        self.stage_seconds = self.metrics.histogram("stage_seconds", "各阶段耗时（秒）")
+        self.queries_total = self.metrics.counter("queries_total", "天气查询次数，按结果")
+        self.upstream_responses = self.metrics.counter("upstream_responses_total", "上游接口响应次数，按接口和状态码")
+        self.in_flight = self.metrics.gauge("in_flight", "进行中的查询和上游请求数")
+        self.metrics.add_collector(self._collect_metrics)
+        self.metrics_file = config.get("metrics-file", "")
+        self.metrics_host = config.get("metrics-host", "127.0.0.1")
+        self.metrics_port = config.get("metrics-port", 0)
+        self.metrics_admins = config.get("metrics-admins", [])
+        self._metrics_runner = None
+
+        # 查询队列：固定数量的 worker 处理天气查询，排队数达到上限时用缓存回答或提示稍后再试；同一聊天的相同查询排队时合并
+        self.dispatcher = WorkQueue(
+            self._run_query,
+            workers=config.get("dispatch-workers", 8),
+            max_depth=config.get("dispatch-queue-size", 100),
+            on_wait=lambda seconds: self.stage_seconds.observe(seconds, stage="queue"),
+        )
+
         # 设置日志
         self.logger = logging.getLogger(self.name)
         self.logger.setLevel(logging.INFO)
@@ -115,73 +399,799 @@ class GetWeather(PluginBase):
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
 
+        # 日志经队列由后台线程写出；log-sample-rate 控制逐请求日志的采样比例，log-body-limit 限制响应体长度
+        self.log_body_limit = config.get("log-body-limit", 500)
+        self._log_listener = None
+        if config.get("log-queue", True):
+            self._log_listener = start_queue_logging(self.logger, list(self.logger.handlers),
+                                                     sample_rate=config.get("log-sample-rate", 1.0))
+
         self.logger.info(f"插件 {self.name} v{self.version} 初始化完成")
 
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，不存在或已关闭时创建"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_pool_limit,
+                limit_per_host=self.http_pool_limit_per_host,
+                use_dns_cache=True,
+                ttl_dns_cache=self.http_dns_cache_ttl,
+                keepalive_timeout=self.http_keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self.logger.info(
+                f"创建共享HTTP会话: limit={self.http_pool_limit}, "
+                f"limit_per_host={self.http_pool_limit_per_host}, dns_ttl={self.http_dns_cache_ttl}s"
+            )
+        return self._session
+
+    async def close_session(self):
+        """关闭共享的HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            self.logger.info("共享HTTP会话已关闭")
+        self._session = None
+
+    async def async_init(self):
+        """插件加载后在线程中签发第一个token，第一条查询不用等待签名"""
+        await super().async_init()
+        await self.refresh_jwt_token()
+        await self._load_location_aliases()
+        if self.persistent_cache is not None:
+            await self._warm_from_persistent_cache()
+        if self.metrics_port:
+            await self._start_metrics_server()
+
+    async def on_disable(self):
+        """插件禁用/卸载时释放连接池"""
+        await super().on_disable()
+        await self._cancel_background_tasks()
+        await self.dispatcher.close()
+        await self.close_session()
+        if self.canonicalizer.dirty:
+            await self.save_location_aliases(None)
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+        if self.persistent_cache is not None:
+            await asyncio.to_thread(self.persistent_cache.close)
+            self.persistent_cache = None
+        if self._log_listener is not None:
+            stop_queue_logging(self.logger, self._log_listener)
+            self._log_listener = None
+        if self.city_index is not None:
+            self.city_index.close()
+            self.city_index = None
+        self.canonicalizer.index = None
+        self._city_index_loaded = False
+
+    @staticmethod
+    def _load_signing_key(pem: str):
+        """把 PEM 格式的 Ed25519 私钥解析为密钥对象，之后签名不再重复解析"""
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        try:
+            key = load_pem_private_key(pem.encode(), password=None)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"api-key 不是有效的PEM私钥: {e}") from e
+        if not isinstance(key, Ed25519PrivateKey):
+            raise ValueError("api-key 必须是 Ed25519 私钥")
+        return key
+
+    def _sign_token(self) -> tuple:
+        """签发新的JWT token，返回 (token, 过期时间)；只做CPU计算，可以在线程中执行"""
+        current_time_unix = int(time.time())
+        # iat 提前30秒，兼容时钟误差
+        payload = {
+            'iat': current_time_unix - 30,
+            'exp': current_time_unix + self.token_default_lifespan,
+            'sub': self.jwt_sub
+        }
+        token = jwt.encode(payload, self.signing_key, algorithm='EdDSA', headers={'kid': self.jwt_kid})
+        return token, payload['exp']
+
+    def _token_needs_refresh(self) -> bool:
+        return not self.cached_token or time.time() >= self.token_expiry_time - self.token_refresh_lead_time
+
+    async def refresh_jwt_token(self, rejected_token: str = None) -> str:
+        """
+        在线程中签发新token并替换缓存。并发调用只签发一次；
+        rejected_token 为被接口拒绝的token，缓存已经换成别的token时直接返回缓存。
+        """
+        if rejected_token is not None and self.cached_token != rejected_token:
+            return self.cached_token
+
+        async def sign():
+            token, expiry = await asyncio.to_thread(self._sign_token)
+            self.cached_token, self.token_expiry_time = token, expiry
+            self.logger.info(f"JWT token已更新，过期时间 {datetime.fromtimestamp(expiry):%Y-%m-%d %H:%M:%S}")
+            return token
+
+        return await self.inflight.do(("jwt",), sign)
+
     def generate_jwt_token(self):
         """
-        生成JWT token.
-        如果存在有效的缓存token,则返回缓存token。
-        否则,生成新token,缓存并返回。
+        返回缓存的JWT token。
+        token 进入提前刷新窗口后在后台签发下一个，当前token在过期前继续使用；
+        只有没有可用token时（首次调用或已过期）才在当前调用中同步签发。
         """
-        current_time_unix = int(time.time())
+        if self._token_needs_refresh():
+            if self.cached_token and time.time() < self.token_expiry_time:
+                self._spawn(self.refresh_jwt_token())
+            else:
+                self.cached_token, self.token_expiry_time = self._sign_token()
+        return self.cached_token
 
-        # 检查缓存的token是否仍然有效且不需要刷新
-        if self.cached_token and current_time_unix < (self.token_expiry_time - self.token_refresh_lead_time):
-            self.logger.info(f"使用缓存的JWT token: {self.cached_token}")
-            return self.cached_token
+    def _api_headers(self) -> dict:
+        """和风天气接口请求头"""
+        with self.stage_seconds.time(stage="jwt"):
+            token = self.generate_jwt_token() # This will now use caching
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate, br" # Common accept encoding
+        }
+
+    async def _request_json(self, session: aiohttp.ClientSession, url: str, headers: dict, endpoint: Endpoint) -> dict:
+        """
+        请求接口并解析JSON，失败时抛出带用户提示的 QWeatherAPIError。
+        可重试的失败按抖动退避重试，整个调用（含重试）的结果计入该接口的熔断器；
+        慢请求按成功的那次HTTP请求本身的耗时判断，不含退避等待和限流等待。
+        """
+        breaker = self.breakers[endpoint.name]
+        if not breaker.allow():
+            self.logger.warning("%sAPI熔断中，跳过请求: %s", endpoint.label, url)
+            raise QWeatherAPIError(endpoint.fail_reply)
 
-        self.logger.info("生成新的JWT token（缓存未命中或需要刷新）。")
+        self.logger.info("请求%sAPI: %s", endpoint.label, url, extra=SAMPLED)
+        self.retry_budget.record_request()
+        started = time.monotonic()
         try:
-            # 构建payload
-            # iat (Issued At) Claim: Time at which the JWT was issued.
-            # We set it slightly in the past to account for potential clock skew.
-            iat_time = current_time_unix - 30
-
-            # exp (过期时间) 声明：JWT 的过期时间。
-            # 示例中使用的是 +900 秒（15 分钟）。
-            # 如果您的 API 提供商允许更长的有效期（例如 24 小时），请调整 token_default_lifespan。
-            exp_time = current_time_unix + self.token_default_lifespan
-
-            payload = {
-                'iat': iat_time,
-                'exp': exp_time,
-                'sub': self.jwt_sub
-            }
+            attempt = 0
+            token_refreshed = False
+            while True:
+                try:
+                    api_json, elapsed = await self._hedged_request(session, url, headers, endpoint)
+                    break
+                except QWeatherAuthError:
+                    # token被拒绝（例如密钥轮换或时钟误差），换新token立即重试一次
+                    if token_refreshed:
+                        raise
+                    token_refreshed = True
+                    token = await self.refresh_jwt_token(headers["Authorization"].removeprefix("Bearer "))
+                    headers = {**headers, "Authorization": f"Bearer {token}"}
+                except (QWeatherAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    retryable = e.retryable if isinstance(e, QWeatherAPIError) else True
+                    if not retryable or attempt >= self.retry_max_attempts or not self.retry_budget.try_withdraw():
+                        raise
+                    delay = backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay)
+                    attempt += 1
+                    self.logger.warning("%sAPI请求失败(%r)，%.2f秒后第%d次重试", endpoint.label, e, delay, attempt)
+                    await asyncio.sleep(delay)
+        except (asyncio.CancelledError, QWeatherRateLimited):
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            if breaker.state == breaker.OPEN:
+                self.logger.warning("%sAPI熔断器打开，%s秒后重试", endpoint.label, breaker.reset_timeout)
+            raise
+        finally:
+            self.stage_seconds.observe(time.monotonic() - started, stage=endpoint.name)
+        breaker.record_success(elapsed)
+        return api_json
 
-            # 构建headers
-            headers = {
-                'kid': self.jwt_kid
-            }
+    async def _hedged_request(self, session: aiohttp.ClientSession, url: str, headers: dict, endpoint: Endpoint) -> tuple:
+        """
+        对冲请求：第一个请求超过该接口近期 p95 耗时仍未返回时，再发一个相同请求，取先成功的结果。
+        对冲请求同样消耗重试预算。返回 (JSON, 成功的那次请求的耗时)。
+        """
+        hedge_delay = self.latency[endpoint.name].percentile(95) if self.hedge_enable else None
+        if hedge_delay is None:
+            return await self._attempt(session, url, headers, endpoint)
 
-            self.logger.info("JWT Generation Details:")
-            self.logger.info(f"  Current Timestamp: {current_time_unix}")
-            self.logger.info(f"  iat (Issued At):   {payload['iat']}")
-            self.logger.info(f"  exp (Expires At):  {payload['exp']}")
-            self.logger.info(f"  Headers: {headers}")
-            self.logger.info(f"  Payload: {payload}")
+        hedge_delay = max(hedge_delay, self.hedge_min_delay)
+        first = asyncio.ensure_future(self._attempt(session, url, headers, endpoint))
+        attempts = {first}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_delay)
+            if not done and self.retry_budget.try_withdraw():
+                self.logger.info("%sAPI超过%.2f秒未返回，发送对冲请求", endpoint.label, hedge_delay, extra=SAMPLED)
+                attempts.add(asyncio.ensure_future(self._attempt(session, url, headers, endpoint)))
+            pending = attempts
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # 全部失败时抛出第一个请求的错误
+            return first.result()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    async def _attempt(self, session: aiohttp.ClientSession, url: str, headers: dict, endpoint: Endpoint) -> tuple:
+        """单次HTTP请求，受该接口的连接/读取超时和限流限制，返回 (JSON, 请求耗时)，耗时不含限流等待"""
+        if not await self._acquire_upstream(endpoint.name):
+            self.logger.warning("%sAPI请求超过限流，放弃请求", endpoint.label)
+            raise QWeatherRateLimited("\n⚠️天气查询太频繁，请稍后重试")
+        self._record_quota(endpoint.name)
+
+        started = time.monotonic()
+        try:
+            with self.in_flight.track(kind="upstream"):
+                async with session.get(url, headers=headers, timeout=self._client_timeout(endpoint.name)) as response:
+                    self.upstream_responses.inc(endpoint=endpoint.name, status=response.status)
+                    # 响应体只读取一次，日志和解码共用
+                    body = await response.read()
+                    if response.status == 401:
+                        self.logger.warning("%sAPI拒绝了JWT token: %s", endpoint.label, truncated(body, self.log_body_limit))
+                        raise QWeatherAuthError(endpoint.fail_reply)
+                    if response.status != 200:
+                        self.logger.error("%sAPI请求失败: %s, Body: %s", endpoint.label, response.status,
+                                          truncated(body, self.log_body_limit))
+                        raise QWeatherAPIError(endpoint.fail_reply, retryable=response.status >= 500 or response.status == 429)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.upstream_responses.inc(endpoint=endpoint.name, status="timeout" if isinstance(e, asyncio.TimeoutError) else "error")
+            raise
+        # 连接已释放，在 async with 之外解码，不占用连接
+        try:
+            api_json = json_codec.loads(body)
+        except ValueError as json_err:
+            self.logger.error("%sAPI响应非JSON: %s, Body: %s. Error: %s", endpoint.label, response.status,
+                              truncated(body, self.log_body_limit), json_err)
+            raise QWeatherAPIError(endpoint.format_reply)
+        elapsed = time.monotonic() - started
+        self.latency[endpoint.name].record(elapsed)
+        return api_json, elapsed
 
-            # 生成token
-            # Ensure self.private_key is the raw private key string, not a path to a file
-            token = jwt.encode(payload, self.private_key, algorithm='EdDSA', headers=headers)
-            self.logger.info(f"成功生成新的JWT token: {token}")
+    async def _acquire_upstream(self, name: str) -> bool:
+        """从全局和接口的令牌桶各取一个令牌（不限制的跳过），最多等待 rate-limit-max-wait 秒"""
+        buckets = [bucket for bucket in (self.upstream_limiter, self.endpoint_limiters.get(name)) if bucket is not None]
+        if not buckets:
+            return True
+        deadline = time.monotonic() + self.rate_limit_max_wait
+        while True:
+            wait = max(bucket.wait_time() for bucket in buckets)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.try_acquire()
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
 
-            # 缓存新token和其过期时间
-            self.cached_token = token
-            self.token_expiry_time = exp_time # Store the calculated expiry time
+    def _record_quota(self, name: str):
+        """记录一次上游调用，用量每跨过一个提醒比例记录一次日志"""
+        self.quota.record(name)
+        used_ratio = self.quota.used / self.quota.daily_quota if self.quota.daily_quota else 0
+        level = sum(used_ratio >= threshold for threshold in (0.5, 0.8, 0.9, 1.0))
+        if level != self._quota_alert_level:
+            self._quota_alert_level = level
+            if level:
+                self.logger.warning(f"和风天气今日调用已用 {self.quota.used}/{self.quota.daily_quota} ({used_ratio:.0%})")
 
-            return token
+    def _allow_query(self, message: dict) -> bool:
+        """用户和群的查询频率限制"""
+        limits = [(message["SenderWxid"], self.user_queries_per_minute)]
+        if message["FromWxid"].endswith("@chatroom"):
+            limits.append((message["FromWxid"], self.group_queries_per_minute))
+        buckets = []
+        for wxid, limit in limits:
+            if not limit:
+                continue
+            bucket = self._query_limiters.get(wxid, None)
+            if bucket is None:
+                bucket = TokenBucket.per_minute(limit)
+                self._query_limiters.set(wxid, bucket)
+            buckets.append(bucket)
+        if any(bucket.wait_time() > 0 for bucket in buckets):
+            return False
+        for bucket in buckets:
+            bucket.try_acquire()
+        return True
+
+    def _client_timeout(self, name: str) -> aiohttp.ClientTimeout:
+        """接口的连接/读取超时，首次使用时创建（避免初始化时导入aiohttp）"""
+        timeout = self._client_timeouts.get(name)
+        if timeout is None:
+            settings = {"connect": self.timeout_connect, "read": self.timeout_read}
+            settings.update(self.endpoint_timeouts.get(name, {}))
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=settings["connect"], sock_read=settings["read"])
+            self._client_timeouts[name] = timeout
+        return timeout
+
+    def _collect_metrics(self):
+        """导出缓存命中、熔断器、配额和请求合并等已有统计"""
+        caches = {"geo": self.geo_cache, **{f"weather_{name}": cache for name, cache in self.weather_cache.items()},
+                  "reply": self.reply_cache}
+        breaker_states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+        canonical = self.canonicalizer.stats()
+        return [
+            ("cache_hits_total", "counter", "缓存命中次数", [({"cache": name}, cache.hits) for name, cache in caches.items()]),
+            ("cache_misses_total", "counter", "缓存未命中次数", [({"cache": name}, cache.misses) for name, cache in caches.items()]),
+            ("cache_entries", "gauge", "缓存条目数", [({"cache": name}, len(cache)) for name, cache in caches.items()]),
+            ("circuit_breaker_state", "gauge", "熔断器状态：0关闭 1半开 2打开",
+             [({"endpoint": name}, breaker_states[breaker.state]) for name, breaker in self.breakers.items()]),
+            ("quota_used", "gauge", "今日上游调用次数",
+             [({"endpoint": name}, count) for name, count in self.quota.usage()["by_endpoint"].items()]),
+            ("quota_remaining", "gauge", "今日剩余配额", [({}, self.quota.remaining)]),
+            ("singleflight_in_flight", "gauge", "进行中的合并请求数", [({}, len(self.inflight))]),
+            ("singleflight_coalesced_total", "counter", "被合并的请求次数", [({}, self.inflight.coalesced)]),
+            ("dispatch_queue_depth", "gauge", "排队中的查询数", [({}, self.dispatcher.depth)]),
+            ("dispatch_busy_workers", "gauge", "正在执行查询的worker数", [({}, self.dispatcher.busy)]),
+            ("dispatch_merged_total", "counter", "排队时合并的相同查询次数", [({}, self.dispatcher.merged)]),
+            ("dispatch_rejected_total", "counter", "队列已满被拒绝的查询次数", [({}, self.dispatcher.rejected)]),
+            ("location_keys", "gauge", "规范化后的地名键数", [({}, canonical["keys"])]),
+            ("location_raw_variants", "gauge", "规范化前的不同地名写法数", [({}, canonical["raw"])]),
+            ("location_aliases", "gauge", "地名别名数，按来源",
+             [({"source": "config"}, canonical["manual"]), ({"source": "learned"}, canonical["learned"])]),
+            ("location_alias_hits_total", "counter", "按别名改写地名的次数", [({}, canonical["alias_hits"])]),
+        ]
+
+    def metrics_summary(self) -> str:
+        """管理员命令的简要指标：各阶段次数和耗时、缓存命中率、配额"""
+        lines = ["天气插件运行指标"]
+        for labels in self.stage_seconds.series():
+            stats = self.stage_seconds.summary(labels)
+            lines.append(f"{dict(labels)['stage']}: {stats['count']}次 平均{stats['avg'] * 1000:.1f}ms "
+                         f"p50≤{stats['p50'] * 1000:g}ms p95≤{stats['p95'] * 1000:g}ms")
+        caches = {"城市": self.geo_cache, **{f"天气{name}": cache for name, cache in self.weather_cache.items()},
+                  "回复": self.reply_cache}
+        lines.append("缓存命中率: " + ", ".join(f"{name} {cache.stats()['hit_rate']:.0%}" for name, cache in caches.items()))
+        dispatch = self.dispatcher.stats()
+        lines.append(f"查询队列: 排队{dispatch['depth']}/{dispatch['max_depth']} 执行中{dispatch['busy']}/{dispatch['workers']} "
+                     f"合并{dispatch['merged']} 拒绝{dispatch['rejected']}")
+        canonical = self.canonicalizer.stats()
+        lines.append(f"地名规范化: {canonical['raw']}种写法 -> {canonical['keys']}个键，"
+                     f"别名{canonical['manual'] + canonical['learned']}条（学到{canonical['learned']}条）")
+        usage = self.quota.usage()
+        lines.append(f"今日调用: {usage['used']}/{usage['quota']} {usage['by_endpoint']}")
+        return "\n".join(lines)
+
+    def location_report(self, top: int = 10) -> str:
+        """管理员命令的地名规范化报告：合并写法最多的键，以及每个键合并了哪些原始写法"""
+        canonical = self.canonicalizer.stats()
+        lines = [f"地名规范化报告: {canonical['raw']}种写法 -> {canonical['keys']}个键"]
+        for key, count, raws in self.canonicalizer.report(top):
+            lines.append(f"{key}: {count}种写法 {'、'.join(raws)}")
+        if len(lines) == 1:
+            lines.append("暂无合并的写法")
+        return "\n".join(lines)
+
+    async def _start_metrics_server(self):
+        """在本地端口提供 /metrics（Prometheus 文本格式）"""
+        from aiohttp import web
+
+        async def handle_metrics(request):
+            return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._metrics_runner = web.AppRunner(app, access_log=None)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, self.metrics_host, self.metrics_port).start()
+        self.logger.info(f"指标服务已启动: http://{self.metrics_host}:{self.metrics_port}/metrics")
 
+    def _persist(self, namespace: str, key: str, value, ttl: float, keep: float = 0):
+        """写入持久化缓存（未启用时忽略），不等待完成"""
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(namespace, key, value, ttl, keep)
+
+    async def _warm_from_persistent_cache(self):
+        """启动时从持久化缓存加载城市和天气结果，重启后的查询直接命中，不会集中请求上游"""
+        started = time.monotonic()
+        try:
+            entries = await self.persistent_cache.load_all()
         except Exception as e:
-            self.logger.error(f"生成JWT token失败: {str(e)}", exc_info=True)
-            # Invalidate cache on error to force regeneration next time
-            self.cached_token = None
-            self.token_expiry_time = 0
-            raise
+            self.logger.error(f"加载持久化缓存失败: {self.persistent_cache.path}, {e}")
+            return
+        now = time.time()
+        fresh = 0
+        for namespace, key, entry in entries:
+            remaining = entry.remaining(now)
+            if namespace == GEO_ENDPOINT.name:
+                if remaining > 0:
+                    self.geo_cache.set(key, entry.value, ttl=remaining)
+                    fresh += 1
+                continue
+            if remaining > 0:
+                self.weather_cache[namespace].set(key, entry.value, ttl=remaining)
+                fresh += 1
+            self.stale_weather[namespace].set(key, (entry.fetched_at, entry.value), ttl=entry.keep_until - now)
+        self.logger.info(f"已从持久化缓存加载 {len(entries)} 条（未过期 {fresh} 条），"
+                         f"耗时 {(time.monotonic() - started) * 1e3:.0f} ms")
+
+    def _spawn(self, coro) -> asyncio.Task:
+        """启动后台任务并保留引用，任务失败时记录日志"""
+        task = asyncio.ensure_future(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    async def _cancel_background_tasks(self):
+        """
+        取消并等待后台任务（后台刷新等）和它们等待的合并请求（shield 的共享任务不会随等待者取消），
+        关闭会话和持久化缓存后不会再请求上游或写入
+        """
+        tasks = list(self._background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.inflight.close()
+
+    def _background_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.warning(f"后台任务失败: {task.exception()!r}")
+
+    async def _get_city_index(self):
+        """获取离线城市索引，首次调用时在线程中加载（CSV 需要解析，索引文件只做 mmap）"""
+        if not self._city_index_loaded:
+            await self.inflight.do(("city-index",), self._load_city_index)
+        return self.city_index
+
+    async def _load_city_index(self):
+        path = self.city_index_path
+        if path and os.path.exists(path):
+            try:
+                self.city_index = await asyncio.to_thread(CityIndex.open, path)
+                self.canonicalizer.index = self.city_index
+                self.logger.info(f"已加载离线城市索引: {path}, {len(self.city_index)} 个地名")
+            except (OSError, ValueError) as e:
+                self.logger.error(f"加载离线城市索引失败: {path}, {e}")
+        self._city_index_loaded = True
+
+    async def _get_subscriptions(self) -> SubscriptionStore:
+        """获取订阅存储，首次调用时在线程中读取文件"""
+        if not self._subscriptions_loaded:
+            await self.inflight.do(("subscriptions",), self._load_subscriptions)
+        return self.subscriptions
+
+    async def _load_subscriptions(self):
+        try:
+            await asyncio.to_thread(self.subscriptions.load)
+            self.logger.info(f"已加载天气订阅: {len(self.subscriptions)} 条")
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.error(f"加载天气订阅失败: {self.subscriptions.path}, {e}")
+        self._subscriptions_loaded = True
+
+    async def _save_subscriptions(self):
+        """在事件循环中生成快照，在线程中写文件"""
+        async with self._subscriptions_lock:
+            await asyncio.to_thread(write_atomic, self.subscriptions.path, self.subscriptions.dumps())
+
+    async def _load_location_aliases(self):
+        try:
+            await asyncio.to_thread(self.canonicalizer.load)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.logger.error(f"加载地名别名失败: {self.canonicalizer.path}, {e}")
+            return
+        if self.canonicalizer.learned:
+            self.logger.info(f"已加载地名别名: {len(self.canonicalizer.learned)} 条")
+
+    async def _canonical_locations(self, locations) -> tuple:
+        """
+        地名规范化（有离线城市索引时先加载，用于拼音和确认后缀），返回发给城市查询接口的地名；
+        缓存键相同的地名只保留第一个
+        """
+        await self._get_city_index()
+        queries = {}
+        for request_loc in locations:
+            query = self.canonicalizer.canonical(request_loc)
+            if query:
+                queries.setdefault(self.canonicalizer.key(query), query)
+        return tuple(queries.values())
+
+    async def _segment_location(self, text: str) -> str:
+        """解析器无法确定地名时的兜底：在线程中使用 jieba 分词，未启用或未安装时直接去掉关键词"""
+        if self.jieba_fallback:
+            try:
+                return await asyncio.to_thread(segment_location, self.query_parser.strip_keyword(text))
+            except ImportError:
+                self.logger.warning("未安装jieba，已关闭分词兜底")
+                self.jieba_fallback = False
+        return self.query_parser.strip_keyword(text)
+
+    async def _resolve_location(self, session: aiohttp.ClientSession, request_loc: str, headers: dict):
+        """
+        查询城市信息，依次使用离线城市索引、地名缓存，都未命中时才请求城市查询接口。
+        返回 Location 记录，未找到城市时返回 None；接口业务错误抛出 QWeatherAPIError。
+        """
+        await self._get_city_index()
+        location_info = self._known_location(request_loc)
+        if location_info is not MISSING:
+            return location_info
+
+        cache_key = self.canonicalizer.key(request_loc)
+
+        # 相同地名的并发查询只请求一次城市查询接口
+        return await self.inflight.do(
+            ("geo", cache_key),
+            lambda: self._lookup_location(session, request_loc, cache_key, headers),
+        )
+
+    def _known_location(self, request_loc: str):
+        """
+        不请求上游查找城市：离线城市索引（依次用地名和缓存键），然后是学到的地名别名和地名缓存。
+        返回 Location 记录，缓存的“未找到”返回 None，都没有时返回 MISSING。
+        """
+        cache_key = self.canonicalizer.key(request_loc)
+        if self.city_index is not None:
+            for name in dict.fromkeys((request_loc, cache_key)):
+                found = self.city_index.lookup(name)
+                if found is not None:
+                    self.logger.debug("离线城市索引命中: %s -> %s", name, found["id"], extra=SAMPLED)
+                    return Location.from_json(found)
+        location_info = self.canonicalizer.resolve(cache_key)
+        if location_info is not None:
+            self.logger.debug("地名别名命中: %s -> %s", cache_key, location_info.id, extra=SAMPLED)
+            return location_info
+        location_info = self.geo_cache.get(cache_key)
+        if location_info is not MISSING:
+            self.logger.debug("城市查询缓存命中: %s", cache_key, extra=SAMPLED)
+        return location_info
+
+    async def _lookup_location(self, session: aiohttp.ClientSession, request_loc: str, cache_key: str, headers: dict):
+        """请求城市查询接口并写入地名缓存；持久化缓存中有未过期的结果（例如其他进程查询过）时直接使用"""
+        if self.persistent_cache is not None:
+            entry = (await self.persistent_cache.get(GEO_ENDPOINT.name, [cache_key])).get(cache_key)
+            if entry is not None and entry.remaining() > 0:
+                self.geo_cache.set(cache_key, entry.value, ttl=entry.remaining())
+                if entry.value is not None:
+                    self.canonicalizer.learn(cache_key, entry.value)
+                return entry.value
+
+        geo_api_url = f'{self.api_host}/geo/v2/city/lookup?location={request_loc}'
+        geoapi_json = await self._request_json(session, geo_api_url, headers, GEO_ENDPOINT)
+
+        self.logger.debug("城市查询API响应: %s", truncated(geoapi_json, self.log_body_limit), extra=SAMPLED)
+
+        code = geoapi_json.get('code')
+        if code == '404' or not geoapi_json.get("location"):
+            self.logger.info("未找到城市: %s. API Response: %s", request_loc, truncated(geoapi_json, self.log_body_limit),
+                             extra=SAMPLED)
+            if code in ('404', '200'):
+                self.geo_cache.set(cache_key, None, ttl=self.geo_cache_negative_ttl)
+                self._persist(GEO_ENDPOINT.name, cache_key, None, self.geo_cache_negative_ttl)
+            return None
+        elif code != '200':
+            self.logger.error("城市查询API业务错误: %s", truncated(geoapi_json, self.log_body_limit))
+            error_msg = geoapi_json.get('message', '未知错误')
+            raise QWeatherAPIError(f"\n⚠️城市查询失败: {error_msg}")
+
+        location_info = Location.from_json(geoapi_json["location"][0])
+        self.geo_cache.set(cache_key, location_info)
+        self.canonicalizer.learn(cache_key, location_info)
+        self._persist(GEO_ENDPOINT.name, cache_key, location_info, self.geo_cache.ttl)
+        return location_info
+
+    def _weather_cache_ttl(self, name: str, record) -> float:
+        """
+        根据记录的 updateTime 推算缓存时间：数据在 updateTime + 刷新周期 后才会更新，
+        结果限制在 [weather-cache-min-ttl, 刷新周期] 之间；无法解析时直接使用刷新周期。
+        """
+        refresh_interval = self.weather_cache_ttl[name]
+        try:
+            update_ts = datetime.fromisoformat(record.update_time).timestamp()
+        except (TypeError, ValueError):
+            return refresh_interval
+        remaining = update_ts + refresh_interval - time.time()
+        return max(self.weather_cache_min_ttl, min(remaining, refresh_interval))
+
+    async def _fetch_weather(self, session: aiohttp.ClientSession, city_id: str, headers: dict,
+                             endpoints=WEATHER_ENDPOINTS) -> tuple:
+        """
+        获取城市的天气数据，返回 ({接口名: 记录}, 旧数据的秒数)；缓存命中的接口不再请求。
+        有上次成功的数据时：熔断打开、请求失败或超过 stale-latency-budget 仍未返回，都先返回旧数据，
+        并在后台继续请求（重新验证）；今日配额不足时直接返回旧数据。返回新数据时第二项为 None。
+        """
+        weather = {}
+        missing = {}
+        for name, endpoint in endpoints.items():
+            cached = self.weather_cache[name].get(city_id)
+            if cached is MISSING:
+                missing[name] = endpoint
+            else:
+                weather[name] = cached
+
+        if not missing:
+            self.logger.debug("天气缓存命中: %s", city_id, extra=SAMPLED)
+            return weather, None
+
+        def fetch():
+            return self._fetch_shared(session, city_id, headers, missing)
+
+        stale = {name: self.stale_weather[name].get(city_id) for name in missing}
+        if any(entry is MISSING for entry in stale.values()):
+            weather.update(await fetch())
+            return weather, None
+
+        if self.quota.low:
+            self.logger.info("今日配额不足，使用旧数据: %s", city_id, extra=SAMPLED)
+        elif any(self.breakers[endpoint.name].is_open for endpoint in missing.values()):
+            self.logger.warning("天气接口熔断中，使用旧数据: %s", city_id)
+            self._spawn(fetch())
+        else:
+            task = self._spawn(fetch())
+            done, _ = await asyncio.wait({task}, timeout=self.stale_latency_budget)
+            if task in done and task.exception() is None:
+                weather.update(task.result())
+                return weather, None
+            self.logger.warning("天气接口%s，使用旧数据: %s", "请求失败" if task in done else "响应过慢", city_id)
+
+        fetched_at = min(fetched_at for fetched_at, _ in stale.values())
+        weather.update({name: record for name, (_, record) in stale.items()})
+        return weather, time.time() - fetched_at
+
+    async def _fetch_shared(self, session: aiohttp.ClientSession, city_id: str, headers: dict, endpoints: dict,
+                            min_remaining: float = 0) -> dict:
+        """
+        并发请求多个接口，每个接口单独 single-flight：不同查询类型、用户查询和预取需要的接口有重叠时，
+        同一城市的同一接口只请求一次。任一接口失败时按 endpoints 顺序抛出第一个错误；
+        其他接口不取消，它们可能有其他等待者，结果照常写入缓存。
+        """
+        results = await asyncio.gather(*(
+            self.inflight.do(
+                ("weather", city_id, name),
+                lambda endpoint=endpoint: self._fetch_and_cache_weather(
+                    session, city_id, headers, endpoint, min_remaining=min_remaining),
+            )
+            for name, endpoint in endpoints.items()
+        ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return dict(zip(endpoints, results))
+
+    async def _fetch_planned(self, session: aiohttp.ClientSession, city_id: str, headers: dict, names: tuple) -> tuple:
+        """
+        并发获取规划出的接口，每个接口分别经过缓存、旧数据和熔断处理（_fetch_weather），某个接口失败不影响其他接口。
+        返回 ({接口名: 记录或异常}, 旧数据的秒数)，都是新数据时第二项为 None。
+        """
+        results = await asyncio.gather(
+            *(self._fetch_weather(session, city_id, headers, {name: CITY_ENDPOINTS[name]}) for name in names),
+            return_exceptions=True,
+        )
+        weather = {}
+        stale_age = None
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                weather[name] = result
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            records, age = result
+            weather[name] = records[name]
+            if age is not None:
+                stale_age = max(stale_age or 0, age)
+        return weather, stale_age
+
+    def _render_intents(self, location_info: Location, intents: tuple, weather: dict, with_header: bool = True) -> str:
+        """把各接口的结果交给对应查询类型的回复函数，接口失败的类型只给出提示"""
+        sections = []
+        for intent in intents:
+            records = [weather[name] for name in INTENTS[intent].endpoints]
+            error = next((record for record in records if isinstance(record, Exception)), None)
+            if error is not None:
+                sections.append(self._error_text(error, intent))
+            elif intent == DEFAULT_INTENT:
+                sections.append(self.compose_weather_message(
+                    location_info.id, location_info.country, location_info.adm1, location_info.adm2, *records,
+                    with_header=False,
+                ))
+            else:
+                location = f"{location_info.country}{location_info.adm1}{location_info.adm2}"
+                sections.append(RENDERERS[intent](location, *records))
+        message = "\n\n".join(sections)
+        return WEATHER_MESSAGE_HEADER + "\n" + message if with_header else message
+
+    def _error_text(self, error: Exception, intent: str) -> str:
+        """多种查询类型合并回复时，失败的类型对应的提示"""
+        if isinstance(error, QWeatherAPIError):
+            return error.reply.strip()
+        if isinstance(error, (aiohttp.ClientError, TimeoutError)):
+            self.logger.error("网络请求错误(%s): %r", intent, error)
+            return f"⚠️{INTENTS[intent].label}：网络连接超时或错误，请稍后重试。"
+        self.logger.error("查询%s时发生未知错误: %s", INTENTS[intent].label, error, exc_info=error)
+        return f"⚠️{INTENTS[intent].label}：处理查询时发生内部错误，请稍后重试。"
+
+    async def _fetch_and_cache_weather(self, session: aiohttp.ClientSession, city_id: str, headers: dict,
+                                       endpoint: Endpoint, min_remaining: float = 0):
+        """
+        请求一个天气接口，转换为记录并写入天气缓存和旧数据；接口返回业务错误时抛出 QWeatherAPIError。
+        持久化缓存中剩余有效时间超过 min_remaining 时（例如其他进程刚请求过）不再请求。
+        """
+        name = endpoint.name
+        if self.persistent_cache is not None:
+            entry = (await self.persistent_cache.get(name, [city_id])).get(city_id)
+            if entry is not None and entry.remaining() > min_remaining:
+                self.weather_cache[name].set(city_id, entry.value, ttl=entry.remaining())
+                self.stale_weather[name].set(city_id, (entry.fetched_at, entry.value), ttl=entry.keep_until - time.time())
+                return entry.value
+
+        api_json = await self._request_json(
+            session, f"{self.api_host}{endpoint.path}?location={city_id}{endpoint.params}", headers, endpoint)
+        code = api_json.get("code")
+        if code == "204":
+            # 请求成功但该地区没有这类数据（例如部分城市没有空气质量）
+            raise QWeatherAPIError(f"\n⚠️该地区暂无{endpoint.label}数据。")
+        if code != "200":
+            self.logger.error("天气API业务错误: %s %s", name, code)
+            raise QWeatherAPIError("\n⚠️获取天气数据时出错，请稍后再试。")
+
+        record = endpoint.record.from_json(api_json)
+        ttl = self._weather_cache_ttl(name, record)
+        self.weather_cache[name].set(city_id, record, ttl=ttl)
+        self.stale_weather[name].set(city_id, (time.time(), record))
+        self._persist(name, city_id, record, ttl, keep=self.stale_max_age)
+        return record
+
+    async def _query_city(self, session: aiohttp.ClientSession, request_loc: str, headers: dict,
+                          with_header: bool = True, intents: tuple = (DEFAULT_INTENT,)) -> str:
+        """
+        查询单个城市并生成消息，失败时抛出带用户提示的 QWeatherAPIError。
+        intents 需要的接口合并去重后并发请求；部分查询类型失败时只在对应位置提示，全部失败时抛出第一个错误。
+        """
+        with self.stage_seconds.time(stage="resolve"):
+            location_info = await self._resolve_location(session, request_loc, headers)
+        if location_info is None:
+            raise LocationNotFound(f"\n⚠️未查询到“{request_loc}”的信息，请检查城市名称。")
+
+        city_id = location_info.id
+        self.popularity.record(city_id)
+
+        # 各接口互不依赖，并发请求
+        names = plan(intents)
+        with self.stage_seconds.time(stage="weather"):
+            weather, stale_age = await self._fetch_planned(session, city_id, headers, names)
+        errors = [weather[name] for name in names if isinstance(weather[name], Exception)]
+        if errors and all(any(isinstance(weather[name], Exception) for name in INTENTS[intent].endpoints)
+                          for intent in intents):
+            raise errors[0]
+
+        with self.stage_seconds.time(stage="compose"):
+            out_message = self._render_intents(location_info, intents, weather, with_header=with_header)
+        if stale_age is not None:
+            out_message += "\n" + self.stale_notice(stale_age)
+        return out_message
+
+    async def _query_cities(self, session: aiohttp.ClientSession, locations: tuple, headers: dict,
+                            intents: tuple = (DEFAULT_INTENT,), quiet: bool = False) -> str:
+        """
+        并发查询多个城市（并发数受 batch-concurrency 限制），合并为一条消息。
+        单个城市失败时只在对应位置给出提示，不影响其他城市；quiet 时所有地名都没有找到则抛出 LocationNotFound。
+        """
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        not_found = []
+
+        async def query(request_loc):
+            async with semaphore:
+                try:
+                    return await self._query_city(session, request_loc, headers, with_header=False, intents=intents)
+                except QWeatherAPIError as e:
+                    if isinstance(e, LocationNotFound):
+                        not_found.append(e)
+                    return f"【{request_loc}】{e.reply.strip()}"
+                except (aiohttp.ClientError, TimeoutError) as e:
+                    self.logger.error("网络请求错误(%s): %r", request_loc, e, exc_info=True)
+                    return f"【{request_loc}】⚠️网络连接超时或错误，请稍后重试。"
+                except Exception as e:
+                    self.logger.error("查询%s天气时发生未知错误: %s", request_loc, e, exc_info=True)
+                    return f"【{request_loc}】⚠️处理天气查询时发生内部错误，请稍后重试。"
+
+        sections = await asyncio.gather(*(query(request_loc) for request_loc in locations))
+        if quiet and len(not_found) == len(locations):
+            raise not_found[0]
+        return WEATHER_MESSAGE_HEADER + "\n" + "\n\n".join(sections)
 
     @on_text_message
     async def handle_text(self, bot: WechatAPIClient, message: dict):
         """处理文本消息"""
-        if "天气" not in message["Content"]:
+        if not self.query_parser.has_keyword(message["Content"]):
             return
 
         if message.get("_processed", False):
@@ -189,188 +1199,401 @@ class GetWeather(PluginBase):
 
         message["_processed"] = True
 
-        command_segments = list(jieba.cut(message["Content"]))
+        if message["Content"].strip() == METRICS_COMMAND and message["SenderWxid"] in self.metrics_admins:
+            await bot.send_at_message(message["FromWxid"], "\n" + self.metrics_summary(), [message["SenderWxid"]])
+            return
+        if message["Content"].strip() == LOCATION_REPORT_COMMAND and message["SenderWxid"] in self.metrics_admins:
+            await bot.send_at_message(message["FromWxid"], "\n" + self.location_report(), [message["SenderWxid"]])
+            return
 
-        if len(command_segments) == 1 and "天气" in command_segments:
-            await bot.send_at_message(message["FromWxid"], "\n请指定城市名称，例如：天气 北京", [message["SenderWxid"]])
+        if not self._allow_query(message):
+            self.queries_total.inc(result="limited")
+            self.logger.info("查询过于频繁: %s %s", message["FromWxid"], message["SenderWxid"], extra=SAMPLED)
+            await bot.send_at_message(message["FromWxid"], "\n⚠️查询太频繁，请稍后再试。", [message["SenderWxid"]])
+            return
+
+        try:
+            command = parse_subscription_command(message["Content"])
+        except ValueError as e:
+            await bot.send_at_message(message["FromWxid"], f"\n⚠️{e}，例如：订阅天气 北京 7:30", [message["SenderWxid"]])
             return
-        
-        # 移除"天气"关键词并组合城市名
-        city_name_parts = [word for word in command_segments if word != "天气"]
-        if not city_name_parts: # e.g. "天气" alone was handled, but "天气 " might lead here
+        if command is not None:
+            if not self.push_enable:
+                await bot.send_at_message(message["FromWxid"], "\n天气推送功能未开启。", [message["SenderWxid"]])
+            else:
+                await self._handle_subscription(bot, message, command)
+            return
+
+        with self.stage_seconds.time(stage="parse"):
+            query = self.query_parser.parse(message["Content"])
+            if query is not None:
+                intents, locations = query.intents, query.locations
+            else:
+                intents = self.query_parser.intents(message["Content"])
+                locations = self.query_parser.split_locations(await self._segment_location(message["Content"]))
+            locations = await self._canonical_locations(locations)
+        # 不含“天气”的消息（例如“空气质量 北京”）只有地名能查到时才回复，否则当作闲聊
+        quiet = not self.query_parser.explicit(message["Content"])
+
+        if not locations:
+            if quiet:
+                return
             await bot.send_at_message(message["FromWxid"], "\n请指定城市名称，例如：天气 北京", [message["SenderWxid"]])
             return
 
-        request_loc = "".join(city_name_parts)
-        
+        if len(locations) > self.max_cities:
+            await bot.send_at_message(message["FromWxid"], f"\n一次最多查询{self.max_cities}个城市，请分开查询。", [message["SenderWxid"]])
+            return
+
         # 简单校验一下，避免过长的无效请求
-        if len(request_loc) > 20: # Arbitrary length limit
-            self.logger.info(f"Request location too long: {request_loc}")
+        if any(len(request_loc) > 20 for request_loc in locations): # Arbitrary length limit
+            self.logger.info("Request location too long: %s", locations, extra=SAMPLED)
             await bot.send_at_message(message["FromWxid"], "\n城市名称过长，请检查。", [message["SenderWxid"]])
             return
 
 
+        # 同一聊天中排队的相同查询合并为一次，回复时 @ 所有发送者（地名已规范化，不同写法也会合并）
+        key = (message["FromWxid"], intents, tuple(map(self.canonicalizer.key, locations)), quiet)
         try:
-            token = self.generate_jwt_token() # This will now use caching
-            api_headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json",
-                "Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate, br" # Common accept encoding
-            }
+            await self.dispatcher.submit(key, (bot, message, locations))
+        except QueueFull:
+            await self._shed_query(bot, message, locations, intents, quiet)
+
+        return False # Message handled
 
-            geo_api_url = f'{self.api_host}/geo/v2/city/lookup?location={request_loc}'
-            self.logger.info(f"请求城市查询API: {geo_api_url}")
+    async def _run_query(self, key: tuple, items: list):
+        """查询队列的 handler：items 为合并进来的 (bot, message, locations)，只查询一次，回复时 @ 所有发送者"""
+        bot, _, locations = items[0]
+        chat, intents, _, quiet = key
+        senders = list(dict.fromkeys(message["SenderWxid"] for _, message, _ in items))
+        with self.in_flight.track(kind="query"), self.stage_seconds.time(stage="query"):
+            try:
+                api_headers = self._api_headers()
+                session = await self._get_session()
+                async with asyncio.timeout(self.query_timeout):
+                    if len(locations) == 1:
+                        out_message = await self._query_city(session, locations[0], api_headers, intents=intents)
+                    else:
+                        out_message = await self._query_cities(session, locations, api_headers, intents=intents,
+                                                               quiet=quiet)
+                with self.stage_seconds.time(stage="send"):
+                    await bot.send_at_message(chat, "\n" + out_message, senders)
+                self.queries_total.inc(len(items), result="ok")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(geo_api_url, headers=api_headers) as response:
-                    response_text = await response.text() # Get raw text for better debugging
-                    if response.status != 200:
-                        self.logger.error(f"城市查询API请求失败: {response.status}, Body: {response_text}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️城市查询服务暂时不可用，请稍后重试", [message["SenderWxid"]])
-                        return
-                    try:
-                        geoapi_json = await response.json(content_type=None) # Allow any content type for json parsing
-                    except aiohttp.ContentTypeError as json_err:
-                        self.logger.error(f"城市查询API响应非JSON: {response.status}, Body: {response_text}. Error: {json_err}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️城市查询服务响应格式错误", [message["SenderWxid"]])
-                        return
-
-
-            self.logger.debug(f"城市查询API响应: {geoapi_json}")
-
-            if geoapi_json.get('code') == '404' or not geoapi_json.get("location"):
-                self.logger.info(f"未找到城市: {request_loc}. API Response: {geoapi_json}")
-                await bot.send_at_message(message["FromWxid"], f"\n⚠️未查询到“{request_loc}”的信息，请检查城市名称。", [message["SenderWxid"]])
-                return
-            elif geoapi_json.get('code') != '200':
-                self.logger.error(f"城市查询API业务错误: {geoapi_json}")
-                error_msg = geoapi_json.get('message', '未知错误')
-                await bot.send_at_message(message["FromWxid"], f"\n⚠️城市查询失败: {error_msg}", [message["SenderWxid"]])
+            except LocationNotFound as e:
+                self.queries_total.inc(len(items), result="api_error")
+                if quiet:
+                    self.logger.info("未找到地名，不是天气查询: %s", locations, extra=SAMPLED)
+                    return
+                await bot.send_at_message(chat, e.reply, senders)
+            except QWeatherAPIError as e:
+                self.queries_total.inc(len(items), result="api_error")
+                await bot.send_at_message(chat, e.reply, senders)
+            except jwt.exceptions.InvalidKeyError as e:
+                self.queries_total.inc(len(items), result="error")
+                self.logger.error(f"JWT密钥无效，请检查config.toml中的api-key格式: {str(e)}", exc_info=True)
+                await bot.send_at_message(chat, f"\n⚠️天气服务认证配置错误，请联系管理员。", senders)
+            except (aiohttp.ClientError, TimeoutError) as e:
+                self.queries_total.inc(len(items), result="network_error")
+                self.logger.error("网络请求错误: %r", e, exc_info=True)
+                await bot.send_at_message(chat, f"\n⚠️网络连接超时或错误，请稍后重试。", senders)
+            except Exception as e:
+                self.queries_total.inc(len(items), result="error")
+                self.logger.error("处理天气查询时发生未知错误: %s", e, exc_info=True)
+                await bot.send_at_message(chat, f"\n⚠️处理天气查询时发生内部错误，请稍后重试。", senders)
+
+    async def _shed_query(self, bot: WechatAPIClient, message: dict, locations: tuple, intents: tuple, quiet: bool = False):
+        """查询队列已满：缓存（含旧数据）中有全部城市的数据时直接回答，否则提示稍后再试（quiet 时不回复）"""
+        out_message = self._cached_reply(locations, intents)
+        if out_message is None:
+            self.queries_total.inc(result="shed")
+            self.logger.info("查询队列已满，拒绝查询: %s", locations, extra=SAMPLED)
+            if quiet:
                 return
+            await bot.send_at_message(message["FromWxid"], "\n⚠️查询的人太多了，请稍后再试。", [message["SenderWxid"]])
+            return
+        self.queries_total.inc(result="shed_cached")
+        self.logger.info("查询队列已满，使用缓存回答: %s", locations, extra=SAMPLED)
+        await bot.send_at_message(message["FromWxid"], "\n" + out_message, [message["SenderWxid"]])
 
-            location_info = geoapi_json["location"][0]
-            country = location_info.get("country", "")
-            adm1 = location_info.get("adm1", "")
-            adm2 = location_info.get("adm2", "")
-            city_id = location_info["id"]
-
-            now_weather_api_url = f'{self.api_host}/v7/weather/now?location={city_id}'
-            self.logger.info(f"请求实时天气API: {now_weather_api_url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(now_weather_api_url, headers=api_headers) as response:
-                    response_text_now = await response.text()
-                    if response.status != 200:
-                        self.logger.error(f"实时天气API请求失败: {response.status}, Body: {response_text_now}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️获取实时天气失败，请稍后重试", [message["SenderWxid"]])
-                        return
-                    try:
-                        now_weather_api_json = await response.json(content_type=None)
-                    except aiohttp.ContentTypeError as json_err:
-                        self.logger.error(f"实时天气API响应非JSON: {response.status}, Body: {response_text_now}. Error: {json_err}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️实时天气服务响应格式错误", [message["SenderWxid"]])
-                        return
-
-
-            weather_forecast_api_url = f'{self.api_host}/v7/weather/7d?location={city_id}'
-            self.logger.info(f"请求天气预报API: {weather_forecast_api_url}")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(weather_forecast_api_url, headers=api_headers) as response:
-                    response_text_forecast = await response.text()
-                    if response.status != 200:
-                        self.logger.error(f"天气预报API请求失败: {response.status}, Body: {response_text_forecast}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️获取天气预报失败，请稍后重试", [message["SenderWxid"]])
-                        return
-                    try:
-                        weather_forecast_api_json = await response.json(content_type=None)
-                    except aiohttp.ContentTypeError as json_err:
-                        self.logger.error(f"天气预报API响应非JSON: {response.status}, Body: {response_text_forecast}. Error: {json_err}")
-                        await bot.send_at_message(message["FromWxid"], "\n⚠️天气预报服务响应格式错误", [message["SenderWxid"]])
-                        return
-
-
-            if now_weather_api_json.get("code") != "200" or weather_forecast_api_json.get("code") != "200":
-                 self.logger.error(f"天气API业务错误. Now: {now_weather_api_json.get('code')}, Forecast: {weather_forecast_api_json.get('code')}")
-                 await bot.send_at_message(message["FromWxid"], "\n⚠️获取天气数据时出错，请稍后再试。", [message["SenderWxid"]])
-                 return
-
-
-            out_message = self.compose_weather_message(country, adm1, adm2, now_weather_api_json, weather_forecast_api_json)
-            await bot.send_at_message(message["FromWxid"], "\n" + out_message, [message["SenderWxid"]])
-
-        except jwt.exceptions.InvalidKeyError as e:
-            self.logger.error(f"JWT密钥无效，请检查config.toml中的api-key格式: {str(e)}", exc_info=True)
-            await bot.send_at_message(message["FromWxid"], f"\n⚠️天气服务认证配置错误，请联系管理员。", [message["SenderWxid"]])
-        except aiohttp.ClientError as e:
-            self.logger.error(f"网络请求错误: {str(e)}", exc_info=True)
-            await bot.send_at_message(message["FromWxid"], f"\n⚠️网络连接超时或错误，请稍后重试。", [message["SenderWxid"]])
+    def _cached_reply(self, locations: tuple, intents: tuple):
+        """只用内存中的城市和天气缓存（含旧数据）生成回复，不请求上游；有城市没有缓存时返回 None"""
+        sections = []
+        for request_loc in locations:
+            section = self._cached_city_message(request_loc, intents, with_header=len(locations) == 1)
+            if section is None:
+                return None
+            sections.append(section)
+        if len(sections) == 1:
+            return sections[0]
+        return WEATHER_MESSAGE_HEADER + "\n" + "\n\n".join(sections)
+
+    def _cached_city_message(self, request_loc: str, intents: tuple, with_header: bool = True):
+        location_info = self._known_location(request_loc)
+        if location_info is MISSING or location_info is None:
+            return None
+
+        weather = {}
+        stale_since = None
+        for name in plan(intents):
+            record = self.weather_cache[name].get(location_info.id)
+            if record is MISSING:
+                stale = self.stale_weather[name].get(location_info.id)
+                if stale is MISSING:
+                    return None
+                fetched_at, record = stale
+                stale_since = fetched_at if stale_since is None else min(stale_since, fetched_at)
+            weather[name] = record
+
+        out_message = self._render_intents(location_info, intents, weather, with_header=with_header)
+        if stale_since is not None:
+            out_message += "\n" + self.stale_notice(time.time() - stale_since)
+        return out_message
+
+    async def _handle_subscription(self, bot: WechatAPIClient, message: dict, command):
+        """处理订阅天气、取消订阅天气、查看天气订阅命令"""
+        chat, wxid = message["FromWxid"], message["SenderWxid"]
+        store = await self._get_subscriptions()
+
+        if command.action == "list":
+            subscriptions = store.list_for(chat, wxid)
+            if not subscriptions:
+                reply = f"\n你还没有订阅天气推送，例如：订阅天气 北京 {self.push_default_time}"
+            else:
+                lines = [f"{s.adm1}{s.adm2} 每天{s.time}" for s in sorted(subscriptions, key=lambda s: s.time)]
+                reply = "\n你的天气订阅：\n" + "\n".join(lines)
+            await bot.send_at_message(chat, reply, [wxid])
+            return
+
+        locations = await self._canonical_locations(self.query_parser.split_locations(command.locations))
+        if command.action == "unsubscribe" and not locations:
+            removed = store.remove(chat, wxid)
+            await self._save_subscriptions()
+            await bot.send_at_message(chat, f"\n已取消全部{len(removed)}条天气订阅。", [wxid])
+            return
+        if not locations:
+            await bot.send_at_message(chat, f"\n请指定城市名称，例如：订阅天气 北京 {self.push_default_time}", [wxid])
+            return
+
+        # 与查询相同：多个城市并发查询，总时长受 query-timeout 限制
+        try:
+            api_headers = self._api_headers()
+            session = await self._get_session()
+            async with asyncio.timeout(self.query_timeout):
+                location_infos = await asyncio.gather(
+                    *(self._resolve_location(session, request_loc, api_headers) for request_loc in locations))
+            resolved = list(zip(locations, location_infos))
+        except QWeatherAPIError as e:
+            await bot.send_at_message(chat, e.reply, [wxid])
+            return
+        except (aiohttp.ClientError, TimeoutError) as e:
+            self.logger.error("网络请求错误: %r", e, exc_info=True)
+            await bot.send_at_message(chat, "\n⚠️网络连接超时或错误，请稍后重试。", [wxid])
+            return
         except Exception as e:
-            self.logger.error(f"处理天气查询时发生未知错误: {str(e)}", exc_info=True)
-            await bot.send_at_message(message["FromWxid"], f"\n⚠️处理天气查询时发生内部错误，请稍后重试。", [message["SenderWxid"]])
+            self.logger.error("处理天气订阅时发生未知错误: %s", e, exc_info=True)
+            await bot.send_at_message(chat, "\n⚠️处理天气订阅时发生内部错误，请稍后重试。", [wxid])
+            return
 
-        return False # Message handled
+        not_found = [request_loc for request_loc, location_info in resolved if location_info is None]
+        if not_found:
+            await bot.send_at_message(chat, f"\n⚠️未查询到“{'、'.join(not_found)}”的信息，请检查城市名称。", [wxid])
+            return
 
-    @staticmethod
-    def compose_weather_message(country, adm1, adm2, now_weather_api_json, weather_forecast_api_json):
-        """构建天气信息消息"""
-        update_time_str = now_weather_api_json.get('updateTime', '未知')
-        now_data = now_weather_api_json.get('now', {})
-        daily_forecast = weather_forecast_api_json.get('daily', [])
+        if command.action == "unsubscribe":
+            removed = [s for _, location_info in resolved for s in store.remove(chat, wxid, location_info.id)]
+            await self._save_subscriptions()
+            await bot.send_at_message(chat, f"\n已取消{len(removed)}条天气订阅。", [wxid])
+            return
+
+        existing = {s.city_id for s in store.list_for(chat, wxid)}
+        new_count = len({location_info.id for _, location_info in resolved} - existing)
+        if len(existing) + new_count > self.push_max_per_user:
+            await bot.send_at_message(chat, f"\n每人最多订阅{self.push_max_per_user}个城市。", [wxid])
+            return
 
-        # Format update time if possible
+        push_time = command.time or self.push_default_time
+        for _, location_info in resolved:
+            store.add(Subscription(
+                chat, wxid, location_info.id, location_info.country, location_info.adm1, location_info.adm2,
+                push_time,
+            ))
+        await self._save_subscriptions()
+        names = "、".join(location_info.name or request_loc for request_loc, location_info in resolved)
+        await bot.send_at_message(chat, f"\n已订阅{names}的天气，每天{push_time}推送。", [wxid])
+
+    @schedule('interval', minutes=1)
+    async def export_metrics(self, bot: WechatAPIClient):
+        """每分钟把指标写入 metrics-file，供 node_exporter 的 textfile collector 等读取"""
+        if self.metrics_file:
+            await asyncio.to_thread(write_atomic, self.metrics_file, self.metrics.render())
+
+    @schedule('interval', minutes=10)
+    async def vacuum_persistent_cache(self, bot: WechatAPIClient):
+        """删除持久化缓存中超过保留时间的条目"""
+        if self.persistent_cache is None:
+            return
+        deleted = await self.persistent_cache.vacuum()
+        if deleted:
+            self.logger.info(f"持久化缓存清理 {deleted} 条过期条目")
+        if self.persistent_cache.write_errors:
+            self.logger.warning(f"持久化缓存写入失败 {self.persistent_cache.write_errors} 次")
+            self.persistent_cache.write_errors = 0
+        if self.persistent_cache.decode_errors:
+            self.logger.warning(f"持久化缓存删除无法解析的条目 {self.persistent_cache.decode_errors} 条")
+            self.persistent_cache.decode_errors = 0
+
+    @schedule('interval', minutes=10)
+    async def save_location_aliases(self, bot: WechatAPIClient):
+        """学到新的地名别名时写入 location-alias-file（在事件循环中生成快照，在线程中写文件）"""
+        if not self.canonicalizer.dirty or not self.canonicalizer.path:
+            return
+        self.canonicalizer.dirty = False
         try:
-            # Example: 2023-10-26T10:35+08:00 -> 10-26 10:35
-            dt_obj = datetime.fromisoformat(update_time_str)
-            formatted_update_time = dt_obj.strftime("%m-%d %H:%M")
-        except:
-            formatted_update_time = update_time_str # Fallback
-
-        message = (
-            f"----- 小胰宝助手提醒您关注天气 -----\n"
-            f"{country}{adm1}{adm2} 实时天气☁️\n"
-            f"⏰更新时间：{formatted_update_time}\n\n"
-            f"🌡️当前温度：{now_data.get('temp','N/A')}℃\n"
-            f"🌡️体感温度：{now_data.get('feelsLike','N/A')}℃\n"
-            f"☁️天气：{now_data.get('text','N/A')}\n"
-        )
-        
-        # UV Index might be in today's forecast (index 0 of daily)
-        if daily_forecast:
-            message += f"☀️紫外线指数：{daily_forecast[0].get('uvIndex','N/A')}\n"
-        
-        message += (
-            f"🌬️风向：{now_data.get('windDir','N/A')}\n"
-            f"🌬️风力：{now_data.get('windScale','N/A')}级\n"
-            f"💦湿度：{now_data.get('humidity','N/A')}%\n"
-            f"🌧️降水量：{now_data.get('precip','N/A')}mm/h\n"
-            f"👀能见度：{now_data.get('vis','N/A')}km\n\n"
+            await asyncio.to_thread(write_atomic, self.canonicalizer.path, self.canonicalizer.dumps())
+        except OSError as e:
+            self.canonicalizer.dirty = True
+            self.logger.error(f"保存地名别名失败: {self.canonicalizer.path}, {e}")
+
+    @schedule('interval', minutes=1)
+    async def rotate_jwt_token(self, bot: WechatAPIClient):
+        """token进入提前刷新窗口时在后台签发下一个，长时间没有查询时也不会让请求等待签名"""
+        if self._token_needs_refresh():
+            await self.refresh_jwt_token()
+
+    @schedule('interval', minutes=1)
+    async def prefetch_hot_cities(self, bot: WechatAPIClient):
+        """后台刷新热门城市即将过期（或已过期）的天气缓存，用户查询时直接命中"""
+        self.popularity.prune()
+        if not self.prefetch_enable or not self.popularity or self.quota.low:
+            return
+
+        today = datetime.now().date()
+        if self._prefetch_day != today:
+            self._prefetch_day = today
+            self._prefetch_calls_today = 0
+        budget = int(self.api_daily_quota * self.prefetch_quota_share) - self._prefetch_calls_today
+        if budget <= 0:
+            return
+
+        plan = []
+        for city_id, _ in self.popularity.top(self.prefetch_top_n, min_score=self.prefetch_min_score):
+            endpoints = {
+                name: endpoint for name, endpoint in WEATHER_ENDPOINTS.items()
+                if (self.weather_cache[name].remaining(city_id) or 0) <= self.prefetch_lead_time
+            }
+            if endpoints:
+                if len(endpoints) > budget:
+                    break
+                budget -= len(endpoints)
+                plan.append((city_id, endpoints))
+        if not plan:
+            return
+
+        api_headers = self._api_headers()
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def refresh(city_id, endpoints):
+            async with semaphore:
+                # 与用户查询共用按接口的 single-flight 键，避免同时重复请求
+                await self._fetch_shared(session, city_id, api_headers, endpoints,
+                                         min_remaining=self.prefetch_lead_time)
+
+        self._prefetch_calls_today += sum(len(endpoints) for _, endpoints in plan)
+        results = await asyncio.gather(*(refresh(city_id, endpoints) for city_id, endpoints in plan),
+                                       return_exceptions=True)
+        failed = sum(isinstance(result, BaseException) for result in results)
+        self.logger.info(f"预取热门城市天气: {len(plan)} 个城市, 失败 {failed} 个, 今日已用 {self._prefetch_calls_today} 次")
+
+    @schedule('interval', minutes=1)
+    async def push_weather(self, bot: WechatAPIClient):
+        """每分钟检查一次到期的天气订阅"""
+        if not self.push_enable:
+            return
+
+        store = await self._get_subscriptions()
+        now = datetime.now().replace(second=0, microsecond=0)
+        # 上次检查之后的每个时间点都要推送；停机后最多补推1小时内错过的订阅
+        checked_until = self._push_checked_until or now - timedelta(minutes=1)
+        checked_until = max(checked_until, now - timedelta(hours=1))
+        push_times = []
+        while checked_until < now:
+            checked_until += timedelta(minutes=1)
+            push_times.append(checked_until.strftime("%H:%M"))
+        self._push_checked_until = now
+
+        due = store.due(push_times)
+        if due:
+            await self._push_subscriptions(bot, due)
+
+    async def _push_subscriptions(self, bot: WechatAPIClient, due: list):
+        """
+        推送到期的订阅：每个城市只请求一次天气并生成一次消息，
+        同一会话订阅同一城市的人合并为一条消息，发送速度受 push-rate 限制。
+        """
+        by_city = defaultdict(list)
+        for subscription in due:
+            by_city[subscription.city_id].append(subscription)
+
+        api_headers = self._api_headers()
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def render(city_id, subscriptions):
+            async with semaphore:
+                weather, stale_age = await self._fetch_weather(session, city_id, api_headers)
+                first = subscriptions[0]
+                out_message = self.compose_weather_message(city_id, first.country, first.adm1, first.adm2,
+                                                           weather["now"], weather["7d"])
+                if stale_age is not None:
+                    out_message += "\n" + self.stale_notice(stale_age)
+                return out_message
+
+        city_messages = await asyncio.gather(
+            *(render(city_id, subscriptions) for city_id, subscriptions in by_city.items()),
+            return_exceptions=True,
         )
 
-        if adm2: # Use specific district/city name if available for forecast title
-            message += f"☁️未来3天 {adm2} 天气：\n"
-        elif adm1:
-             message += f"☁️未来3天 {adm1} 天气：\n"
-        else:
-            message += f"☁️未来3天天气：\n"
+        send_interval = 1 / self.push_rate if self.push_rate > 0 else 0
+        sent = 0
+        for (city_id, subscriptions), out_message in zip(by_city.items(), city_messages):
+            if isinstance(out_message, BaseException):
+                self.logger.error(f"推送天气时获取城市{city_id}天气失败: {out_message}")
+                continue
+            by_chat = defaultdict(list)
+            for subscription in subscriptions:
+                by_chat[subscription.chat].append(subscription.wxid)
+            for chat, wxids in by_chat.items():
+                if sent:
+                    await asyncio.sleep(send_interval)
+                try:
+                    if chat.endswith("@chatroom"):
+                        await bot.send_at_message(chat, "\n" + out_message, wxids)
+                    else:
+                        await bot.send_text_message(chat, out_message)
+                    sent += 1
+                except Exception as e:
+                    self.logger.error(f"发送天气推送失败: {chat}, {str(e)}", exc_info=True)
 
+        self.logger.info(f"天气推送完成: {len(due)} 条订阅, {len(by_city)} 个城市, 发送 {sent} 条消息")
 
-        # Iterate through the next 3 days of forecast (index 1, 2, 3 of daily array)
-        # API usually gives today as index 0, then next days
-        for day_forecast in daily_forecast[1:4]: # Slicing handles cases where fewer than 3 days are returned
-            date_str = day_forecast.get('fxDate', 'N/A')
-            # Format date if possible: 2023-10-27 -> 10.27
-            try:
-                formatted_date = '.'.join([d.lstrip('0') for d in date_str.split('-')[1:]])
-            except:
-                formatted_date = date_str
-
-            weather_text = day_forecast.get('textDay', 'N/A')
-            max_temp = day_forecast.get('tempMax', 'N/A')
-            min_temp = day_forecast.get('tempMin', 'N/A')
-            uv_index = day_forecast.get('uvIndex', 'N/A')
-            message += f'{formatted_date} {weather_text} 最高🌡️{max_temp}℃ 最低🌡️{min_temp}℃ ☀️紫外线:{uv_index}\n'
-        
-        if not daily_forecast or len(daily_forecast) < 2:
-            message += "未来几天天气预报数据暂缺。\n"
-
-        return message.strip()
+    @staticmethod
+    def stale_notice(age: float) -> str:
+        """旧数据提示"""
+        minutes = int(age // 60)
+        age_text = f"{minutes // 60}小时{minutes % 60}分钟" if minutes >= 60 else f"{max(minutes, 1)}分钟"
+        return f"⏳天气服务暂时不可用，以上为{age_text}前的数据"
+
+    def compose_weather_message(self, city_id: str, country, adm1, adm2, now: CurrentWeather, forecast: Forecast,
+                                with_header=True):
+        """
+        按回复模板生成天气消息，with_header=False 时省略标题行（多城市合并消息只保留一个标题）。
+        数据的 updateTime 不变时直接使用缓存的消息，同一个群里的相同查询只生成一次。
+        """
+        key = (city_id, now.update_time, forecast.update_time, self.reply_template)
+        message = self.reply_cache.get(key)
+        if message is MISSING:
+            message = self.reply_template.render(country, adm1, adm2, now, forecast)
+            self.reply_cache.set(key, message)
+        return WEATHER_MESSAGE_HEADER + "\n" + message if with_header else message
@@ -0,0 +1,169 @@
+"""
+轻量的进程内指标：计数器、仪表和直方图，导出为 Prometheus 文本格式。
+
+记录一次只是字典查找加整数自增（直方图多一次二分查找），可以在生产环境常开；
+缓存命中率、熔断器状态等已有统计通过 collector 回调在导出时读取，不在热路径上重复计数。
+"""
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 默认直方图分桶（秒），覆盖从内存操作到接口超时的范围
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数，按标签组合分别计数"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values = defaultdict(int)  # labels -> value
+
+    def inc(self, amount: float = 1, **labels):
+        self._values[tuple(labels.items())] += amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    """可增可减的当前值，例如进行中的请求数"""
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self._values[tuple(labels.items())] -= amount
+
+    def set(self, value: float, **labels):
+        self._values[tuple(labels.items())] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """进入时加一，退出时减一"""
+        key = tuple(labels.items())
+        self._values[key] += 1
+        try:
+            yield
+        finally:
+            self._values[key] -= 1
+
+
+class Histogram:
+    """固定分桶的耗时分布，导出 _bucket/_sum/_count"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [每个桶的计数..., +Inf桶计数, sum]
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.items())
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时，抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, labels: tuple) -> dict:
+        """次数、平均耗时和按分桶估算的 p50/p95（取所在桶的上界）"""
+        series = self._series[labels]
+        count = sum(series[:-1])
+        result = {"count": count, "avg": series[-1] / count if count else 0.0}
+        for name, q in (("p50", 0.5), ("p95", 0.95)):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                if count and cumulative >= q * count:
+                    result[name] = bound
+                    break
+            else:
+                result[name] = 0.0
+        return result
+
+    def series(self):
+        return list(self._series)
+
+    def samples(self):
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", labels, series[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """指标注册表，render() 输出 Prometheus 文本格式"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(Counter(self.prefix + name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help))
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, buckets))
+
+    def add_collector(self, collector):
+        """
+        注册导出时调用的回调，返回 [(名称, 类型, 说明, [(标签dict, 值)])]，
+        用于导出缓存、熔断器、配额等已有对象的统计。
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self._collectors:
+            for name, metric_type, help, samples in collector():
+                name = self.prefix + name
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,162 @@
+"""
+持久化缓存：城市查询和天气结果保存到 SQLite（WAL 模式），重启后直接加载，同一台机器上的多个机器人进程共享同一个文件。
+
+每个条目记录获取时间、过期时间（之后不再作为新数据使用）和保留时间（之后作为旧数据也不再使用，由 vacuum 删除），
+都是 Unix 时间戳，进程之间通用。所有数据库操作在一个专用线程中执行，不阻塞事件循环；写入不等待完成。
+
+记录按字段顺序存为 JSON 数组，namespace 带上格式版本（例如 geo@v1）：不同版本的插件进程共用同一个文件时，
+各自只读写自己版本的条目，其他版本的条目不读取，过了保留时间由 vacuum 删除。
+无法还原的条目（字段数不对等）当作未命中并删除，不影响同一批的其他条目。
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    keep_until REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID
+"""
+
+
+class Entry(NamedTuple):
+    value: Any
+    fetched_at: float
+    expires_at: float
+    keep_until: float
+
+    def remaining(self, now: float = None) -> float:
+        """距离过期的秒数，已过期时为负数"""
+        return self.expires_at - (time.time() if now is None else now)
+
+
+class PersistentCache:
+    """
+    decoders 为 {namespace: 函数}，把 JSON 数组还原为记录；值为 None（例如城市不存在的负缓存）时不调用。
+    version 为记录的格式版本，记录的字段有变化时加一。
+    """
+
+    def __init__(self, path: str, decoders: dict, version: int = 1, busy_timeout: float = 5.0):
+        self.path = path
+        self.decoders = decoders
+        self.version = version
+        self._suffix = f"@v{version}"
+        self.busy_timeout = busy_timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GetWeatherCache")
+        self._conn = None
+        self.write_errors = 0
+        self.decode_errors = 0  # 无法还原而删除的条目数
+
+    # 以下 _ 开头的方法只在专用线程中执行
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _decode(self, namespace: str, key: str, row):
+        """还原条目；无法还原时删除该条目并返回 None"""
+        try:
+            value = json.loads(row[0])
+            if value is not None:
+                value = self.decoders[namespace](value)
+        except (ValueError, TypeError, KeyError, IndexError):
+            self.decode_errors += 1
+            self._connection().execute("DELETE FROM entries WHERE namespace = ? AND key = ?",
+                                       (namespace + self._suffix, key))
+            return None
+        return Entry(value, row[1], row[2], row[3])
+
+    def _get(self, namespace: str, keys: list, now: float) -> dict:
+        conn = self._connection()
+        result = {}
+        for key in keys:
+            row = conn.execute(
+                "SELECT value, fetched_at, expires_at, keep_until FROM entries"
+                " WHERE namespace = ? AND key = ? AND keep_until > ?",
+                (namespace + self._suffix, key, now),
+            ).fetchone()
+            entry = None if row is None else self._decode(namespace, key, row)
+            if entry is not None:
+                result[key] = entry
+        return result
+
+    def _put(self, namespace: str, key: str, value: str, fetched_at: float, expires_at: float, keep_until: float):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace + self._suffix, key, value, fetched_at, expires_at, keep_until),
+        )
+
+    def _load_all(self, now: float) -> list:
+        rows = self._connection().execute(
+            "SELECT namespace, key, value, fetched_at, expires_at, keep_until FROM entries"
+            " WHERE keep_until > ? AND namespace LIKE ? ORDER BY fetched_at",
+            (now, "%" + self._suffix),
+        ).fetchall()
+        result = []
+        for stored, key, *row in rows:
+            namespace = stored[:-len(self._suffix)]
+            if namespace not in self.decoders:
+                continue
+            entry = self._decode(namespace, key, row)
+            if entry is not None:
+                result.append((namespace, key, entry))
+        return result
+
+    def _vacuum(self, now: float) -> int:
+        conn = self._connection()
+        deleted = conn.execute("DELETE FROM entries WHERE keep_until <= ?", (now,)).rowcount
+        # 把 WAL 写回主文件并截断，避免 WAL 文件持续增长
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return deleted
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # 事件循环中调用的接口
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, namespace: str, keys: list) -> dict:
+        """读取未超过保留时间的条目，返回 {key: Entry}"""
+        return await self._run(self._get, namespace, list(keys), time.time())
+
+    def put(self, namespace: str, key: str, value, ttl: float, keep: float):
+        """写入条目（不等待完成）：ttl 秒内为新数据，keep 秒内可以作为旧数据"""
+        now = time.time()
+        future = self._executor.submit(self._put, namespace, key, json.dumps(value, ensure_ascii=False),
+                                       now, now + ttl, now + max(ttl, keep))
+        future.add_done_callback(self._put_done)
+
+    def _put_done(self, future):
+        if future.exception() is not None:
+            self.write_errors += 1
+
+    async def load_all(self) -> list:
+        """读取全部有效条目 [(namespace, key, Entry)]，按获取时间从旧到新排列，用于启动时预热内存缓存"""
+        return await self._run(self._load_all, time.time())
+
+    async def vacuum(self) -> int:
+        """删除超过保留时间的条目，返回删除的条数"""
+        return await self._run(self._vacuum, time.time())
+
+    def close(self):
+        """等待未完成的写入后关闭数据库（阻塞，应在线程中调用）"""
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,27 @@
+"""
+查询类型到和风天气接口的规划：每种查询类型只请求生成回复需要的接口；一条消息包含多种类型时合并所需接口，
+共用的接口只请求一次。接口名对应 main.CITY_ENDPOINTS，回复由 templates.RENDERERS（默认天气为回复模板）生成。
+"""
+from typing import NamedTuple
+
+
+class Intent(NamedTuple):
+    name: str
+    label: str
+    endpoints: tuple  # 生成回复需要的接口名，按出错时优先报告的顺序
+
+
+DEFAULT_INTENT = "weather"
+
+INTENTS = {
+    "weather": Intent("weather", "实时天气和预报", ("now", "7d")),
+    "hourly": Intent("hourly", "逐小时预报", ("24h",)),
+    "air": Intent("air", "空气质量", ("air",)),
+    "warning": Intent("warning", "天气预警", ("warning",)),
+    "indices": Intent("indices", "生活指数", ("indices",)),
+}
+
+
+def plan(intents) -> tuple:
+    """按查询类型的顺序合并需要的接口并去重，返回接口名"""
+    return tuple(dict.fromkeys(name for intent in intents for name in INTENTS[intent].endpoints))
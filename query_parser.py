@@ -0,0 +1,123 @@
+"""
+天气查询解析：从 "天气 城市"、"天气城市"、"城市天气"、"城市 天气" 等格式中提取地名，
+多个城市用顿号、逗号、分号或斜杠分隔，例如 "天气 北京、上海、广州"。
+除 "天气" 外，"逐小时"、"空气质量"、"天气预警"、"生活指数" 等关键词指定查询类型，一条消息可以包含多个，
+例如 "北京空气质量和天气预警"。不含 "天气" 的消息只有关键词在开头或结尾时才算查询（"空气质量 北京"、"北京空气质量怎么样"），
+"今天空气质量好差" 这类闲聊不算。
+
+只做字符串切分和首尾词剥离，不需要分词词典；无法确定地名时（关键词两侧都有内容）
+返回 None，由调用方决定是否使用 jieba 分词兜底（segment_location）。
+"""
+import re
+from typing import NamedTuple, Optional
+
+KEYWORD = "天气"
+
+# 查询类型关键词 -> 类型（planner.INTENTS 的键），按长度优先匹配，"天气预警" 不会被当作 "天气"
+INTENT_KEYWORDS = {
+    KEYWORD: "weather",
+    "逐小时天气": "hourly",
+    "逐小时预报": "hourly",
+    "小时天气": "hourly",
+    "逐小时": "hourly",
+    "空气质量": "air",
+    "空气污染": "air",
+    "天气预警": "warning",
+    "气象预警": "warning",
+    "预警信息": "warning",
+    "生活指数": "indices",
+    "天气指数": "indices",
+}
+
+# 地名前面常见的修饰词，按长度优先匹配
+PREFIX_FILLERS = ("查一下", "查一查", "查询", "查下", "请问", "今天", "现在", "实时", "查", "看看")
+# 地名或关键词后面常见的语气词
+SUFFIX_FILLERS = ("怎么样", "咋样", "如何", "情况", "预报", "的", "呢", "吗", "啊", "呀")
+
+_SEPARATORS = re.compile(r"[\s,，。.!！?？:：;；、~～]+")
+# 两个 ASCII（含全角）单词之间的空白保留为一个空格（"Los Angeles"），汉字之间的空白去掉（"北京 朝阳" -> "北京朝阳"）
+_ASCII_GAP = re.compile(r"(?<=[A-Za-z0-9Ａ-Ｚａ-ｚ０-９])\s+(?=[A-Za-z0-9Ａ-Ｚａ-ｚ０-９])")
+# 多个城市之间的分隔符；空格不算，"北京 朝阳" 表示北京的朝阳区
+_LIST_SEPARATORS = re.compile(r"[、,，;；/]+")
+# 多个关键词之间的连接词，例如 "空气质量和天气预警"
+_CONNECTORS = re.compile(r"[和与及跟还有、,，\s]+")
+
+
+class ParsedQuery(NamedTuple):
+    """解析结果：intents 为去重后的查询类型，locations 为去重后的地名，为空表示未指定城市"""
+    intents: tuple
+    locations: tuple
+
+
+def _alternation(words) -> str:
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+class QueryParser:
+    """天气查询解析器，正则在初始化时编译一次"""
+
+    def __init__(self, intent_keywords: dict = INTENT_KEYWORDS, prefix_fillers=PREFIX_FILLERS,
+                 suffix_fillers=SUFFIX_FILLERS):
+        self.intent_keywords = intent_keywords
+        self._keywords = re.compile(_alternation(intent_keywords))
+        self._leading = re.compile(f"^(?:{_alternation(intent_keywords)})")
+        self._trailing = re.compile(f"(?:{_alternation(intent_keywords)})$")
+        self._prefix = re.compile(f"^(?:{_alternation(prefix_fillers)})+")
+        self._suffix = re.compile(f"(?:{_alternation(suffix_fillers)})+$")
+
+    def _clean(self, part: str) -> str:
+        part = " ".join(filter(None, (_SEPARATORS.sub("", word) for word in _ASCII_GAP.split(part))))
+        part = self._prefix.sub("", part)
+        return self._suffix.sub("", part)
+
+    def has_keyword(self, text: str) -> bool:
+        """消息是否是天气查询：含 "天气" 时总是；其他关键词要在消息开头或结尾（去掉标点和结尾的语气词后）"""
+        if self.explicit(text):
+            return True
+        text = self._suffix.sub("", _SEPARATORS.sub("", text))
+        return self._leading.match(text) is not None or self._trailing.search(text) is not None
+
+    @staticmethod
+    def explicit(text: str) -> bool:
+        """消息含 "天气"，明确是天气查询；否则地名无法解析时应当作闲聊，不回复"""
+        return KEYWORD in text
+
+    def intents(self, text: str) -> tuple:
+        """消息中的查询类型，按出现顺序去重"""
+        return tuple(dict.fromkeys(self.intent_keywords[match] for match in self._keywords.findall(text)))
+
+    def parse(self, text: str) -> Optional[ParsedQuery]:
+        """
+        解析查询。text 不含关键词或地名无法确定时返回 None。
+        """
+        pieces = self._keywords.split(text)
+        if len(pieces) == 1:
+            return None
+        # 关键词把消息分成若干段，地名只能在其中一段；只有连接词的段视为空
+        locations = [self.split_locations(piece) for piece in pieces if not _CONNECTORS.fullmatch(piece)]
+        locations = [piece for piece in locations if piece]
+        if len(locations) > 1:
+            # 例如 "北京天气和上海比"，交给分词兜底
+            return None
+        return ParsedQuery(self.intents(text), locations[0] if locations else ())
+
+    def split_locations(self, text: str) -> tuple:
+        """按分隔符拆分多个地名，去掉修饰词、空项和重复项"""
+        parts = (self._clean(part) for part in _LIST_SEPARATORS.split(text))
+        return tuple(dict.fromkeys(part for part in parts if part))
+
+    def strip_keyword(self, text: str) -> str:
+        """去掉所有关键词后的全部内容，作为无法解析时的地名"""
+        return self._keywords.sub("", text)
+
+
+def segment_location(text: str) -> str:
+    """
+    使用 jieba 分词提取地名：去掉修饰词后拼接剩余词语，text 应已去掉关键词（QueryParser.strip_keyword）。
+    首次调用会加载 jieba 词典（约1秒），应在线程中执行，不要在事件循环中直接调用。
+    """
+    import jieba
+
+    fillers = set(PREFIX_FILLERS) | set(SUFFIX_FILLERS)
+    # 保留分隔符，之后由 QueryParser.split_locations 拆分多个城市；空白保留为一个空格，外文地名的单词之间不会粘连
+    return "".join(word if word.strip() else " " for word in jieba.cut(text) if word not in fillers)
@@ -0,0 +1,199 @@
+"""
+缓存中保存的紧凑天气记录：只保留生成消息需要的字段，用 NamedTuple（元组存储，没有 __dict__），
+天气现象、风向等取值有限的字符串做驻留，数千个城市共用同一个字符串对象。
+"""
+import sys
+from typing import NamedTuple
+
+# 天气预报保留的天数：今天（紫外线指数）+ 之后3天
+FORECAST_DAYS = 4
+# 逐小时预报保留的小时数
+HOURLY_HOURS = 24
+# 记录的格式版本（持久化缓存按版本区分条目），增删或调整任何记录的字段时加一
+FORMAT_VERSION = 1
+
+_intern = sys.intern
+
+
+def _field(obj: dict, key: str, default: str = "N/A") -> str:
+    value = obj.get(key)
+    return default if value is None else value
+
+
+class Location(NamedTuple):
+    id: str
+    name: str
+    country: str
+    adm1: str
+    adm2: str
+
+    @classmethod
+    def from_json(cls, item: dict) -> "Location":
+        """城市查询接口 location 数组的元素，或离线城市索引的查询结果"""
+        return cls(item["id"], item.get("name") or "", _intern(item.get("country") or ""),
+                   _intern(item.get("adm1") or ""), item.get("adm2") or "")
+
+    @classmethod
+    def from_row(cls, row: list) -> "Location":
+        """从持久化缓存中的 JSON 数组还原"""
+        return cls._make(row)
+
+
+class CurrentWeather(NamedTuple):
+    update_time: str
+    temp: str
+    feels_like: str
+    text: str
+    wind_dir: str
+    wind_scale: str
+    humidity: str
+    precip: str
+    vis: str
+
+    @classmethod
+    def from_json(cls, api_json: dict) -> "CurrentWeather":
+        """实时天气接口的响应"""
+        now = api_json.get("now") or {}
+        return cls(
+            _field(api_json, "updateTime", "未知"),
+            _field(now, "temp"),
+            _field(now, "feelsLike"),
+            _intern(_field(now, "text")),
+            _intern(_field(now, "windDir")),
+            _intern(_field(now, "windScale")),
+            _field(now, "humidity"),
+            _field(now, "precip"),
+            _field(now, "vis"),
+        )
+
+    @classmethod
+    def from_row(cls, row: list) -> "CurrentWeather":
+        return cls._make(row)
+
+
+class DailyForecast(NamedTuple):
+    date: str
+    text_day: str
+    temp_max: str
+    temp_min: str
+    uv_index: str
+
+    @classmethod
+    def from_json(cls, day: dict) -> "DailyForecast":
+        return cls(
+            _intern(_field(day, "fxDate")),
+            _intern(_field(day, "textDay")),
+            _field(day, "tempMax"),
+            _field(day, "tempMin"),
+            _intern(_field(day, "uvIndex")),
+        )
+
+
+class Forecast(NamedTuple):
+    update_time: str
+    days: tuple  # (DailyForecast, ...)，第一个为今天
+
+    @classmethod
+    def from_json(cls, api_json: dict, max_days: int = FORECAST_DAYS) -> "Forecast":
+        """每日天气预报接口的响应，只保留前 max_days 天"""
+        daily = api_json.get("daily") or []
+        return cls(_field(api_json, "updateTime", "未知"), tuple(DailyForecast.from_json(day) for day in daily[:max_days]))
+
+    @classmethod
+    def from_row(cls, row: list) -> "Forecast":
+        return cls(row[0], tuple(DailyForecast._make(day) for day in row[1]))
+
+
+class HourlyWeather(NamedTuple):
+    time: str
+    text: str
+    temp: str
+    pop: str  # 降水概率（%）
+
+    @classmethod
+    def from_json(cls, hour: dict) -> "HourlyWeather":
+        return cls(_field(hour, "fxTime"), _intern(_field(hour, "text")), _field(hour, "temp"), _field(hour, "pop"))
+
+
+class HourlyForecast(NamedTuple):
+    update_time: str
+    hours: tuple  # (HourlyWeather, ...)
+
+    @classmethod
+    def from_json(cls, api_json: dict, max_hours: int = HOURLY_HOURS) -> "HourlyForecast":
+        """逐小时预报接口的响应"""
+        hourly = api_json.get("hourly") or []
+        return cls(_field(api_json, "updateTime", "未知"), tuple(HourlyWeather.from_json(hour) for hour in hourly[:max_hours]))
+
+    @classmethod
+    def from_row(cls, row: list) -> "HourlyForecast":
+        return cls(row[0], tuple(HourlyWeather._make(hour) for hour in row[1]))
+
+
+class AirQuality(NamedTuple):
+    update_time: str
+    aqi: str
+    category: str
+    primary: str  # 首要污染物，空气质量为优时为 "NA"
+    pm2p5: str
+    pm10: str
+
+    @classmethod
+    def from_json(cls, api_json: dict) -> "AirQuality":
+        """实时空气质量接口的响应"""
+        now = api_json.get("now") or {}
+        return cls(_field(api_json, "updateTime", "未知"), _field(now, "aqi"), _intern(_field(now, "category")),
+                   _intern(_field(now, "primary")), _field(now, "pm2p5"), _field(now, "pm10"))
+
+    @classmethod
+    def from_row(cls, row: list) -> "AirQuality":
+        return cls._make(row)
+
+
+class WeatherAlert(NamedTuple):
+    title: str
+    severity: str
+    text: str
+
+    @classmethod
+    def from_json(cls, warning: dict) -> "WeatherAlert":
+        return cls(_field(warning, "title", ""), _intern(_field(warning, "severity", "")), _field(warning, "text", ""))
+
+
+class WeatherAlerts(NamedTuple):
+    update_time: str
+    alerts: tuple  # (WeatherAlert, ...)，没有生效的预警时为空
+
+    @classmethod
+    def from_json(cls, api_json: dict) -> "WeatherAlerts":
+        """天气预警接口的响应"""
+        warnings = api_json.get("warning") or []
+        return cls(_field(api_json, "updateTime", "未知"), tuple(WeatherAlert.from_json(warning) for warning in warnings))
+
+    @classmethod
+    def from_row(cls, row: list) -> "WeatherAlerts":
+        return cls(row[0], tuple(WeatherAlert._make(alert) for alert in row[1]))
+
+
+class LifeIndex(NamedTuple):
+    name: str
+    category: str
+
+    @classmethod
+    def from_json(cls, index: dict) -> "LifeIndex":
+        return cls(_intern(_field(index, "name")), _intern(_field(index, "category")))
+
+
+class LifeIndices(NamedTuple):
+    update_time: str
+    indices: tuple  # (LifeIndex, ...)
+
+    @classmethod
+    def from_json(cls, api_json: dict) -> "LifeIndices":
+        """天气指数接口的响应（当天）"""
+        daily = api_json.get("daily") or []
+        return cls(_field(api_json, "updateTime", "未知"), tuple(LifeIndex.from_json(index) for index in daily))
+
+    @classmethod
+    def from_row(cls, row: list) -> "LifeIndices":
+        return cls(row[0], tuple(LifeIndex._make(index) for index in row[1]))
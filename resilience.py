@@ -0,0 +1,197 @@
+import random
+import time
+from collections import defaultdict, deque
+from datetime import date
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败（或慢调用）达到 failure_threshold 次后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30, slow_call_threshold: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于拒绝请求的状态（打开且未到探测时间，或半开且探测请求进行中）"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at < self.reset_timeout
+        return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow(self) -> bool:
+        """请求前调用，返回 False 表示应直接失败"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self, duration: float = 0.0):
+        if self.slow_call_threshold is not None and duration > self.slow_call_threshold:
+            self.record_failure()
+            return
+        self.failures = 0
+        self.state = self.CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """请求被取消、没有结果时调用，释放半开状态的探测名额"""
+        self._probe_in_flight = False
+
+
+class RetryBudget:
+    """
+    重试预算：滑动窗口内的重试（含对冲请求）次数不超过 min_per_second * window + ratio * 请求数，
+    上游故障时重试不会成倍放大请求量。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+
+    def _expire(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        self._expire(now)
+        self._requests.append(now)
+
+    def try_withdraw(self) -> bool:
+        """申请一次重试，预算不足时返回 False"""
+        now = time.monotonic()
+        self._expire(now)
+        if len(self._retries) >= self.min_per_second * self.window + self.ratio * len(self._requests):
+            return False
+        self._retries.append(now)
+        return True
+
+
+class LatencyTracker:
+    """记录最近的请求耗时，用于计算对冲请求的等待时间"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, duration: float):
+        self._samples.append(duration)
+
+    def percentile(self, p: float):
+        """第 p 百分位耗时（秒），样本不足时返回 None"""
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """带完全抖动的指数退避：在 [0, min(cap, base * 2^attempt)] 内随机"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    @classmethod
+    def per_minute(cls, limit: float) -> "TokenBucket":
+        """每分钟 limit 次，允许一分钟内的突发"""
+        return cls(limit / 60, limit)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """还需等待多少秒才有足够的令牌"""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        if self.wait_time(tokens) > 0:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class QuotaCounter:
+    """按自然日统计上游接口调用次数"""
+
+    def __init__(self, daily_quota: int, low_watermark: float = 0.1):
+        self.daily_quota = daily_quota
+        self.low_watermark = low_watermark
+        self.day = date.today()
+        self.by_endpoint = defaultdict(int)
+        self.used = 0
+
+    def _roll(self):
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.by_endpoint.clear()
+            self.used = 0
+
+    def record(self, name: str):
+        self._roll()
+        self.used += 1
+        self.by_endpoint[name] += 1
+
+    @property
+    def remaining(self) -> int:
+        self._roll()
+        return max(0, self.daily_quota - self.used)
+
+    @property
+    def low(self) -> bool:
+        """剩余配额低于 low_watermark 比例时为 True，此时应优先使用缓存"""
+        return self.remaining < self.daily_quota * self.low_watermark
+
+    def usage(self) -> dict:
+        self._roll()
+        return {
+            "day": self.day.isoformat(),
+            "used": self.used,
+            "quota": self.daily_quota,
+            "remaining": self.remaining,
+            "used_ratio": round(self.used / self.daily_quota, 4) if self.daily_quota else 0.0,
+            "by_endpoint": dict(self.by_endpoint),
+        }
@@ -0,0 +1,41 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求：同一个 key 的请求进行中时，后来的调用者等待同一个任务，不再重复请求上游。
+    任务的结果或异常会返回给所有等待者；某个等待者被取消不会取消任务本身。
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Task
+        self.coalesced = 0  # 被合并（未发起上游请求）的调用次数
+
+    async def do(self, key, factory):
+        """执行 factory() 返回的协程；相同 key 已有任务进行中时直接等待该任务"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        # shield：等待者被取消时不取消共享的任务
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 所有等待者都已取消时也读取异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    async def close(self):
+        """取消并等待所有进行中的任务（插件卸载时调用）"""
+        tasks = list(self._calls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,106 @@
+"""
+每日天气推送的订阅存储。
+
+订阅以紧凑的 JSON 数组保存：[会话wxid, 订阅者wxid, 城市ID, 国家, 省, 市, "HH:MM"]，
+写入时先写临时文件再替换，避免进程中断导致文件损坏。
+"""
+import json
+import os
+import re
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+SUBSCRIBE_KEYWORD = "订阅天气"
+UNSUBSCRIBE_KEYWORD = "取消订阅天气"
+LIST_KEYWORDS = ("天气订阅", "我的天气订阅")
+
+_TIME_PATTERN = re.compile(r"(\d{1,2})\s*[:：点时]\s*(\d{1,2})?\s*分?")
+
+
+class Subscription(NamedTuple):
+    chat: str      # 推送到的会话（群或私聊）
+    wxid: str      # 订阅者，群聊中推送时 @ 订阅者
+    city_id: str
+    country: str
+    adm1: str
+    adm2: str
+    time: str      # 每天推送时间 HH:MM
+
+
+class SubscriptionCommand(NamedTuple):
+    action: str    # subscribe / unsubscribe / list
+    locations: str  # 地名原文，由调用方解析
+    time: Optional[str]
+
+
+def parse_subscription_command(text: str) -> Optional[SubscriptionCommand]:
+    """解析订阅相关命令，不是订阅命令时返回 None"""
+    text = text.strip()
+    if text in LIST_KEYWORDS:
+        return SubscriptionCommand("list", "", None)
+    for keyword, action in ((UNSUBSCRIBE_KEYWORD, "unsubscribe"), (SUBSCRIBE_KEYWORD, "subscribe")):
+        if text.startswith(keyword):
+            rest = text[len(keyword):]
+            push_time = None
+            match = _TIME_PATTERN.search(rest)
+            if match:
+                hour, minute = int(match.group(1)), int(match.group(2) or 0)
+                if hour > 23 or minute > 59:
+                    raise ValueError("推送时间格式错误")
+                push_time = f"{hour:02d}:{minute:02d}"
+                rest = rest[:match.start()] + rest[match.end():]
+            return SubscriptionCommand(action, rest.strip(), push_time)
+    return None
+
+
+class SubscriptionStore:
+    """订阅存储，按推送时间建立索引，便于按分钟取出到期的订阅"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._subscriptions = {}  # (chat, wxid, city_id) -> Subscription
+        self._by_time = defaultdict(set)  # "HH:MM" -> {(chat, wxid, city_id)}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for row in data.get("subscriptions", []):
+            self._index(Subscription(*row))
+
+    def dumps(self) -> str:
+        """序列化当前订阅，在事件循环中调用以获得一致的快照"""
+        data = {"version": 1, "subscriptions": [list(subscription) for subscription in self._subscriptions.values()]}
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    def _index(self, subscription: Subscription):
+        key = subscription[:3]
+        old = self._subscriptions.get(key)
+        if old is not None:
+            self._by_time[old.time].discard(key)
+        self._subscriptions[key] = subscription
+        self._by_time[subscription.time].add(key)
+
+    def add(self, subscription: Subscription):
+        """添加订阅，同一会话、同一订阅者、同一城市只保留一条（更新推送时间）"""
+        self._index(subscription)
+
+    def remove(self, chat: str, wxid: str, city_id: str = None) -> list:
+        """取消订阅，city_id 为空时取消该订阅者在该会话的全部订阅，返回被取消的订阅"""
+        removed = [s for s in self.list_for(chat, wxid) if city_id is None or s.city_id == city_id]
+        for subscription in removed:
+            key = subscription[:3]
+            del self._subscriptions[key]
+            self._by_time[subscription.time].discard(key)
+        return removed
+
+    def list_for(self, chat: str, wxid: str) -> list:
+        return [s for s in self._subscriptions.values() if s.chat == chat and s.wxid == wxid]
+
+    def due(self, push_times) -> list:
+        """取出推送时间在 push_times 中的订阅"""
+        return [self._subscriptions[key] for push_time in push_times for key in self._by_time.get(push_time, ())]
+
+    def __len__(self):
+        return len(self._subscriptions)
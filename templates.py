@@ -0,0 +1,227 @@
+"""
+天气回复模板：加载配置时检查字段并编译为（文字, 字段序号, 格式说明）的列表，生成消息时不再解析模板，也不执行模板中的代码。
+
+模板使用 str.format 语法（不支持嵌套字段、属性/下标和 !r 等转换，格式说明只支持对齐、宽度、精度等标准格式），
+可用字段见 FIELDS / DAY_FIELDS。
+值为 None 的字段（例如没有预报数据时的紫外线指数）所在的整行省略。
+逐小时预报、空气质量、天气预警和生活指数使用 RENDERERS 中的固定格式。
+"""
+import re
+from datetime import datetime
+from functools import lru_cache
+from string import Formatter
+
+DEFAULT_TEMPLATE = """\
+{location} 实时天气☁️
+⏰更新时间：{update_time}
+
+🌡️当前温度：{temp}℃
+🌡️体感温度：{feels_like}℃
+☁️天气：{text}
+☀️紫外线指数：{uv_index}
+🌬️风向：{wind_dir}
+🌬️风力：{wind_scale}级
+💦湿度：{humidity}%
+🌧️降水量：{precip}mm/h
+👀能见度：{vis}km
+
+☁️{forecast_title}
+{forecast}"""
+
+DEFAULT_DAY_TEMPLATE = "{date} {text_day} 最高🌡️{temp_max}℃ 最低🌡️{temp_min}℃ ☀️紫外线:{uv_index}"
+
+NO_FORECAST = "未来几天天气预报数据暂缺。"
+
+FIELDS = {
+    "location": "国家+省+市",
+    "country": "国家",
+    "adm1": "省",
+    "adm2": "市",
+    "forecast_area": "预报标题中的地名（市，没有时为省）",
+    "forecast_title": "预报标题（未来3天 北京 天气：，没有地名时为 未来3天天气：）",
+    "update_time": "实时天气更新时间（月-日 时:分）",
+    "temp": "温度",
+    "feels_like": "体感温度",
+    "text": "天气现象",
+    "uv_index": "今天的紫外线指数",
+    "wind_dir": "风向",
+    "wind_scale": "风力等级",
+    "humidity": "相对湿度",
+    "precip": "降水量",
+    "vis": "能见度",
+    "forecast": "未来几天的预报，每天一行（按 day 模板）",
+}
+
+DAY_FIELDS = {
+    "date": "日期（月.日）",
+    "text_day": "白天天气现象",
+    "temp_max": "最高温度",
+    "temp_min": "最低温度",
+    "uv_index": "紫外线指数",
+}
+
+
+@lru_cache(maxsize=256)
+def format_update_time(update_time: str) -> str:
+    """2023-10-26T10:35+08:00 -> 10-26 10:35，无法解析时原样返回"""
+    try:
+        return datetime.fromisoformat(update_time).strftime("%m-%d %H:%M")
+    except ValueError:
+        return update_time
+
+
+@lru_cache(maxsize=256)
+def format_date(date: str) -> str:
+    """2023-10-27 -> 10.27"""
+    return '.'.join(part.lstrip('0') for part in date.split('-')[1:]) or date
+
+
+# 允许的格式说明：[[填充]对齐][符号][#][0][宽度][分组][.精度][类型]，宽度和精度最多两位数
+_FORMAT_SPEC = re.compile(r"(?:[^{}]?[<>=^])?[+\- ]?#?0?\d{0,2}[,_]?(?:\.\d{1,2})?[bcdeEfFgGnosxX%]?")
+
+
+def _parse(source: str, fields: dict) -> list:
+    """
+    解析模板，返回 [(文字, 字段序号, 格式说明)]，字段序号为字段在 fields 中的位置，只有文字时为 None；
+    有未知字段、转换或不支持的格式说明时抛出 ValueError
+    """
+    names = list(fields)
+    try:
+        parts = list(Formatter().parse(source))
+    except ValueError as e:
+        raise ValueError(f"回复模板格式错误: {e}") from e
+    chunks = []
+    for literal, name, spec, conversion in parts:
+        if name is None:
+            chunks.append((literal, None, ""))
+            continue
+        if name not in fields:
+            raise ValueError(f"回复模板中有未知字段 {{{name}}}，可用字段: {', '.join(fields)}")
+        if conversion:
+            raise ValueError(f"回复模板字段 {{{name}}} 不支持转换 !{conversion}")
+        if not _FORMAT_SPEC.fullmatch(spec):
+            raise ValueError(f"回复模板字段 {{{name}}} 的格式说明不支持: {spec}")
+        chunks.append((literal, names.index(name), spec))
+    return chunks
+
+
+def _compile(chunks: list):
+    """把 _parse 的结果编译为函数，参数为 fields 中的字段（按顺序），按序号取值并用 format() 格式化"""
+    chunks = tuple(chunks)
+
+    def render(*values) -> str:
+        return "".join([literal if index is None else literal + format(values[index], spec)
+                        for literal, index, spec in chunks])
+
+    return render
+
+
+class ReplyTemplate:
+    """
+    编译后的回复模板：source 为整条消息，day_source 为预报中每天一行，forecast_days 为预报显示的天数（不含今天）。
+    对象本身作为回复缓存键的一部分，修改模板即换一个对象。
+    """
+
+    def __init__(self, source: str = DEFAULT_TEMPLATE, day_source: str = DEFAULT_DAY_TEMPLATE, forecast_days: int = 3):
+        self.source = source
+        self.day_source = day_source
+        self.forecast_days = forecast_days
+        if "\n" in day_source:
+            raise ValueError("每天的预报模板只能有一行")
+        self._render = _compile(_parse(source, FIELDS))
+        self._render_day = _compile(_parse(day_source, DAY_FIELDS))
+        # 有字段为 None 时按行渲染，省略这些行
+        self._lines = []
+        for line in source.split("\n"):
+            chunks = _parse(line, FIELDS)
+            self._lines.append((_compile(chunks), {index for _, index, _ in chunks if index is not None}))
+        # 用空值渲染一次，格式说明写错（例如 {temp:d}）时加载即报错，而不是在回复时
+        try:
+            self._render(*[""] * len(FIELDS))
+            self._render_day(*[""] * len(DAY_FIELDS))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"回复模板格式错误: {e}") from e
+
+    def render(self, country: str, adm1: str, adm2: str, now, forecast) -> str:
+        """用 records 中的 CurrentWeather、Forecast 生成消息（不含标题行）"""
+        days = forecast.days[1:1 + self.forecast_days]
+        if days:
+            render_day = self._render_day
+            forecast_text = "\n".join(
+                render_day(format_date(day.date), day.text_day, day.temp_max, day.temp_min, day.uv_index)
+                for day in days
+            )
+        else:
+            forecast_text = NO_FORECAST
+        # 地名在这里拼好再放进模板，没有省/市时标题不留多余的空格；顺序与 FIELDS 一致
+        area = adm2 or adm1
+        title = f"未来{self.forecast_days}天 {area} 天气：" if area else f"未来{self.forecast_days}天天气："
+        values = (
+            f"{country}{adm1}{adm2}", country, adm1, adm2, area, title,
+            format_update_time(now.update_time), now.temp, now.feels_like, now.text,
+            forecast.days[0].uv_index if forecast.days else None,
+            now.wind_dir, now.wind_scale, now.humidity, now.precip, now.vis, forecast_text,
+        )
+        if None not in values:
+            return self._render(*values).strip()
+        present = {index for index, value in enumerate(values) if value is not None}
+        return "\n".join(render(*values) for render, names in self._lines if names <= present).strip()
+
+
+@lru_cache(maxsize=256)
+def format_hour(fx_time: str) -> str:
+    """2021-02-16T15:00+08:00 -> 15:00，无法解析时原样返回"""
+    try:
+        return datetime.fromisoformat(fx_time).strftime("%H:%M")
+    except ValueError:
+        return fx_time
+
+
+# 其他查询类型的回复（固定格式），location 为国家+省+市，第二个参数为 records 中对应的记录
+
+
+def render_hourly(location: str, hourly, step: int = 3) -> str:
+    """逐小时预报，每 step 小时一行"""
+    lines = [f"{location} 逐小时预报🕐", f"⏰更新时间：{format_update_time(hourly.update_time)}", ""]
+    lines.extend(f"{format_hour(hour.time)} {hour.text} {hour.temp}℃ 💧降水概率{hour.pop}%"
+                 for hour in hourly.hours[::step])
+    if not hourly.hours:
+        lines.append("逐小时预报数据暂缺。")
+    return "\n".join(lines)
+
+
+def render_air(location: str, air) -> str:
+    primary = "无" if air.primary in ("NA", "N/A", "") else air.primary
+    return (
+        f"{location} 空气质量🌫️\n"
+        f"⏰更新时间：{format_update_time(air.update_time)}\n\n"
+        f"AQI：{air.aqi}（{air.category}）\n"
+        f"首要污染物：{primary}\n"
+        f"PM2.5：{air.pm2p5}μg/m³\n"
+        f"PM10：{air.pm10}μg/m³"
+    )
+
+
+def render_alerts(location: str, alerts) -> str:
+    if not alerts.alerts:
+        return f"{location} 当前没有生效的天气预警✅"
+    sections = [f"{location} 天气预警⚠️"]
+    sections.extend(f"【{alert.title}】\n{alert.text}" if alert.text else f"【{alert.title}】" for alert in alerts.alerts)
+    return "\n\n".join(sections)
+
+
+def render_indices(location: str, indices) -> str:
+    lines = [f"{location} 生活指数📋"]
+    lines.extend(f"{index.name}：{index.category}" for index in indices.indices)
+    if not indices.indices:
+        lines.append("生活指数数据暂缺。")
+    return "\n".join(lines)
+
+
+# 查询类型 -> 回复函数（默认天气使用可配置的回复模板，不在此列）
+RENDERERS = {
+    "hourly": render_hourly,
+    "air": render_air,
+    "warning": render_alerts,
+    "indices": render_indices,
+}